@@ -5,6 +5,9 @@ const supabaseUrl = process.env.VITE_SUPABASE_URL || '';
 const supabaseKey = process.env.VITE_SUPABASE_ANON_KEY || '';
 const supabase = createClient(supabaseUrl, supabaseKey);
 
+const MAX_LOG_BATCH = 500;
+const MAX_LOG_MESSAGE_LENGTH = 4000;
+
 export const GET: APIRoute = async ({ request, params }) => {
   const url = new URL(request.url);
   const action = url.searchParams.get('action');
@@ -276,6 +279,48 @@ export const POST: APIRoute = async ({ request }) => {
         });
       }
 
+      case 'log-batch': {
+        const { logs } = body;
+
+        if (!Array.isArray(logs) || logs.length === 0) {
+          return new Response(JSON.stringify({ error: 'logs array required' }), {
+            status: 400,
+            headers: { 'Content-Type': 'application/json' }
+          });
+        }
+
+        if (logs.length > MAX_LOG_BATCH) {
+          return new Response(JSON.stringify({ error: `At most ${MAX_LOG_BATCH} logs per batch` }), {
+            status: 413,
+            headers: { 'Content-Type': 'application/json' }
+          });
+        }
+
+        if (logs.some((log: any) => !log || !log.session_id || !log.message)) {
+          return new Response(JSON.stringify({ error: 'Each log requires session_id and message' }), {
+            status: 400,
+            headers: { 'Content-Type': 'application/json' }
+          });
+        }
+
+        // One multi-row insert per batch; created_at keeps the time the worker logged it
+        const { error } = await supabase
+          .from('session_script_logs')
+          .insert(logs.map((log: any) => ({
+            session_id: log.session_id,
+            log_level: log.log_level || 'info',
+            message: String(log.message).slice(0, MAX_LOG_MESSAGE_LENGTH),
+            details: log.details || {},
+            ...(log.created_at ? { created_at: log.created_at } : {})
+          })));
+
+        if (error) throw error;
+
+        return new Response(JSON.stringify({ count: logs.length }), {
+          headers: { 'Content-Type': 'application/json' }
+        });
+      }
+
       case 'update-stats': {
         const { session_id, messages_sent, messages_failed, groups_targeted } = body;
 
@@ -286,23 +331,14 @@ export const POST: APIRoute = async ({ request }) => {
           });
         }
 
-        const { data: currentStats } = await supabase
-          .from('session_script_stats')
-          .select('*')
-          .eq('session_id', session_id)
-          .maybeSingle();
-
-        const updates: any = {};
-        if (messages_sent !== undefined) updates.messages_sent = (currentStats?.messages_sent || 0) + messages_sent;
-        if (messages_failed !== undefined) updates.messages_failed = (currentStats?.messages_failed || 0) + messages_failed;
-        if (groups_targeted !== undefined) updates.groups_targeted = groups_targeted;
-
-        const { data, error } = await supabase
-          .from('session_script_stats')
-          .update(updates)
-          .eq('session_id', session_id)
-          .select()
-          .single();
+        // Increments are applied in one atomic upsert, so concurrent flushes
+        // from many sessions never race on a read-modify-write
+        const { data, error } = await supabase.rpc('increment_session_script_stats', {
+          p_session_id: session_id,
+          p_messages_sent: messages_sent || 0,
+          p_messages_failed: messages_failed || 0,
+          p_groups_targeted: groups_targeted ?? null
+        });
 
         if (error) throw error;
 
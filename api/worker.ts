@@ -1,3 +1,4 @@
+import { gzipSync } from 'zlib';
 import { mcp__supabase__execute_sql } from '../services/supabase';
 
 function decodeJwtPayload(token: string): { telegram_id: string; role: string } | null {
@@ -12,6 +13,44 @@ function decodeJwtPayload(token: string): { telegram_id: string; role: string }
   }
 }
 
+const MAX_LONG_POLL_MS = 30000;
+const LONG_POLL_PROBE_MS = 500;
+
+function sleep(ms: number): Promise<void> {
+  return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+function sqlString(value: any): string {
+  if (value === undefined || value === null) return 'NULL';
+  return `'${String(value).replace(/'/g, "''")}'`;
+}
+
+// Job columns the worker actually reads, returned by format=columnar
+const COLUMNAR_JOB_COLUMNS = [
+  'id', 'account_id', 'session_key', 'chat_id', 'template_id', 'template_version',
+  'hourly_sent', 'hourly_limit', 'daily_sent', 'daily_limit'
+];
+
+// Statuses a worker may report through update-jobs
+const JOB_RESULT_STATUSES = ['running', 'done', 'failed', 'released'];
+
+// Smaller bodies aren't worth the CPU of compressing
+const GZIP_MIN_BYTES = 1024;
+
+// res.json, gzipped when the client accepts it and the body is large enough
+function sendJson(req: any, res: any, body: any) {
+  const json = JSON.stringify(body);
+  const acceptsGzip = /\bgzip\b/.test(String(req.headers['accept-encoding'] || ''));
+  if (!acceptsGzip || json.length < GZIP_MIN_BYTES) {
+    return res.json(body);
+  }
+
+  res.setHeader('Content-Type', 'application/json');
+  res.setHeader('Content-Encoding', 'gzip');
+  res.setHeader('Vary', 'Accept-Encoding');
+  return res.end(gzipSync(json));
+}
+
 export default async function handler(req: any, res: any) {
   const authHeader = req.headers.authorization;
   if (!authHeader || !authHeader.startsWith('Bearer ')) {
@@ -28,95 +67,296 @@ export default async function handler(req: any, res: any) {
   const { action } = req.query;
 
   try {
-    // Worker polling for pending jobs
+    // Worker polling for pending jobs: selects, locks, assigns and returns
+    // the claimed rows in one statement so concurrent workers never overlap
     if (action === 'pending-jobs' && req.method === 'GET') {
-      const { limit = 10, account_id, worker_id } = req.query;
+      const {
+        limit = 10,
+        account_id,
+        worker_id,
+        lease_sec = 300,
+        wait_ms = 0,
+        exclude_sessions,
+        per_session_limit,
+        inline_templates,
+        format
+      } = req.query;
+
+      if (!worker_id) {
+        return res.status(400).json({ error: 'worker_id required' });
+      }
+
+      const claimLimit = Math.min(Math.max(parseInt(limit, 10) || 10, 1), 500);
+      const leaseSeconds = Math.min(Math.max(parseInt(lease_sec, 10) || 300, 10), 3600);
+      const waitMs = Math.min(Math.max(parseInt(wait_ms, 10) || 0, 0), MAX_LONG_POLL_MS);
+      // Cap claims per account so one busy account can't fill a worker's whole batch
+      const perSessionLimit = per_session_limit
+        ? Math.min(Math.max(parseInt(per_session_limit, 10) || 1, 1), claimLimit)
+        : null;
+
+      // Sessions the worker knows are cooling down locally
+      const excludedSessions = String(exclude_sessions || '')
+        .split(',')
+        .map((key: string) => key.trim())
+        .filter(Boolean);
+
+      const sessionFilter = excludedSessions.length > 0
+        ? `AND COALESCE(j.session_key, a.session_key) NOT IN (${excludedSessions.map(sqlString).join(',')})`
+        : '';
+      const accountScope = account_id ? `AND a.id = ${sqlString(account_id)}::uuid` : '';
+
+      // Jobs reference their template by id and version. The text is still
+      // inlined unless the worker opts out, since workers that predate the
+      // templates action expect it; those that cache bodies pass
+      // inline_templates=0 and fetch them through the templates action.
+      const inlineTemplates = inline_templates !== '0' && inline_templates !== 'false';
+      // Columnar: only the columns the worker reads, as one array per column
+      const columnar = format === 'columnar';
+
+      // Due queued jobs and lapsed claims are read from separate partial
+      // indexes (idx_jobs_queued_*, idx_jobs_lease_expires), each already in
+      // scheduled_for order, so no branch reads past its LIMIT
+      const jobSources = [
+        `j.status = 'queued' AND j.scheduled_for <= now()`,
+        `j.status = 'assigned' AND j.lease_expires_at < now()`
+      ];
+
+      // Account activity, cooldown and limits are folded into
+      // tg_accounts.eligible_at (see eligible_accounts)
+      const eligibleFrom = `FROM jobs j JOIN eligible_accounts a ON a.id = j.account_id`;
+
+      // Lock the oldest `count` jobs of each source, then merge them back
+      // into scheduled_for order
+      const pickJobs = (from: string, where: string, count: number) => `
+        SELECT merged.id, merged.scheduled_for
+        FROM (
+          ${jobSources.map((source) => `
+            SELECT * FROM (
+              SELECT j.id, j.scheduled_for
+              ${from}
+              WHERE ${source} ${where}
+              ORDER BY j.scheduled_for ASC
+              LIMIT ${count}
+              FOR UPDATE OF j SKIP LOCKED
+            ) source_jobs`).join(' UNION ALL ')}
+        ) merged
+        ORDER BY merged.scheduled_for ASC
+        LIMIT ${count}
+      `;
 
-      let query = `
+      // Oldest claimable job of account a in each source, read without locking
+      const oldestDue = jobSources.map((source) => `
+        (SELECT j.scheduled_for FROM jobs j
+         WHERE ${source} AND j.account_id = a.id ${sessionFilter}
+         ORDER BY j.scheduled_for ASC LIMIT 1)`).join(', ');
+
+      // With a per-account cap, first pick the claimLimit accounts with the
+      // oldest due work, then lock at most perSessionLimit of each one's oldest
+      // jobs (idx_jobs_queued_account). Locking through every eligible account
+      // would hold perSessionLimit x accounts rows and starve concurrent claims.
+      const claimable = perSessionLimit
+        ? `
+          SELECT picked.id
+          FROM (
+            SELECT due.id, due.session_key
+            FROM (
+              SELECT a.id, a.session_key, LEAST(${oldestDue}) AS oldest_due
+              FROM eligible_accounts a
+              WHERE TRUE ${accountScope}
+            ) due
+            WHERE due.oldest_due IS NOT NULL
+            ORDER BY due.oldest_due ASC
+            LIMIT ${claimLimit}
+          ) a
+          CROSS JOIN LATERAL (
+            ${pickJobs('FROM jobs j', `AND j.account_id = a.id ${sessionFilter}`, perSessionLimit)}
+          ) picked
+          ORDER BY picked.scheduled_for ASC
+          LIMIT ${claimLimit}
+        `
+        : `
+          SELECT picked.id
+          FROM (${pickJobs(eligibleFrom, `${sessionFilter} ${accountScope}`, claimLimit)}) picked
+        `;
+
+      // Cheap existence check for long-polling
+      const probeQuery = jobSources
+        .map((source) => `(SELECT 1 ${eligibleFrom} WHERE ${source} ${sessionFilter} ${accountScope} LIMIT 1)`)
+        .join(' UNION ALL ') + ' LIMIT 1';
+
+      const query = `
+        WITH claimable AS (${claimable}),
+        claimed AS (
+          UPDATE jobs j
+          SET
+            status = 'assigned',
+            worker_id = ${sqlString(worker_id)},
+            claimed_at = now(),
+            lease_expires_at = now() + make_interval(secs => ${leaseSeconds})
+          FROM claimable
+          WHERE j.id = claimable.id
+          RETURNING j.*
+        )
         SELECT
+          ${columnar ? `
+          j.id, j.account_id, j.session_key, j.chat_id,
+          camp.template_id, t.version as template_version,
+          a.hourly_sent, a.hourly_limit, a.daily_sent, a.daily_limit` : `
           j.id, j.campaign_id, j.account_id, j.session_key,
           j.chat_id, j.status, j.attempt_count, j.scheduled_for,
-          j.error_message, j.worker_id,
+          j.error_message, j.worker_id, j.claimed_at, j.lease_expires_at,
           a.label as account_label, a.status as account_status,
           a.hourly_sent, a.hourly_limit, a.daily_sent, a.daily_limit,
           a.last_cooldown_until as flood_wait_until,
           c.id as chat_id_bigint, c.title as chat_title,
           camp.name as campaign_name,
-          t.text_md as template_text
-        FROM jobs j
+          camp.template_id, t.version as template_version`}
+          ${inlineTemplates ? ', t.text_md as template_text' : ''}
+        FROM claimed j
         LEFT JOIN tg_accounts a ON j.account_id = a.id
         LEFT JOIN tg_chats c ON j.chat_id = c.id
         LEFT JOIN campaigns camp ON j.campaign_id = camp.id
         LEFT JOIN msg_templates t ON camp.template_id = t.id
-        WHERE j.status = 'queued'
-          AND j.scheduled_for <= now()
-          AND (a.is_active = true OR a.is_active IS NULL)
-          AND (a.last_cooldown_until IS NULL OR a.last_cooldown_until < now())
-          AND (a.hourly_sent < a.hourly_limit OR a.hourly_limit IS NULL)
-          AND (a.daily_sent < a.daily_limit OR a.daily_limit IS NULL)
+        ORDER BY j.scheduled_for ASC
       `;
 
-      if (account_id) {
-        query += ` AND j.account_id = '${account_id}'`;
-      }
+      let result = await mcp__supabase__execute_sql({ query });
 
-      query += ` ORDER BY j.scheduled_for ASC LIMIT ${limit}`;
+      // Long-poll: hold the request with a cheap LIMIT 1 probe until jobs
+      // become eligible or wait_ms elapses, and only then re-run the claim
+      const deadline = Date.now() + waitMs;
+      while ((result.rows?.length || 0) === 0 && Date.now() < deadline) {
+        await sleep(Math.min(LONG_POLL_PROBE_MS, deadline - Date.now()));
 
-      const result = await mcp__supabase__execute_sql({ query });
+        const probe = await mcp__supabase__execute_sql({ query: probeQuery });
 
-      // Update status to 'assigned' and set worker_id
-      if (result.rows && result.rows.length > 0 && worker_id) {
-        const jobIds = result.rows.map((row: any) => `'${row.id}'`).join(',');
-        await mcp__supabase__execute_sql({
-          query: `
-            UPDATE jobs
-            SET status = 'assigned', worker_id = '${worker_id}', claimed_at = now()
-            WHERE id IN (${jobIds})
-          `
+        if (probe.rows && probe.rows.length > 0) {
+          result = await mcp__supabase__execute_sql({ query });
+        }
+      }
+
+      const rows = result.rows || [];
+
+      if (columnar) {
+        const columns = inlineTemplates ? [...COLUMNAR_JOB_COLUMNS, 'template_text'] : COLUMNAR_JOB_COLUMNS;
+        return sendJson(req, res, {
+          format: 'columnar',
+          columns,
+          data: columns.map((column) => rows.map((row: any) => row[column])),
+          count: rows.length
         });
       }
 
+      return sendJson(req, res, {
+        jobs: rows,
+        count: rows.length
+      });
+    }
+
+    // Template bodies by id, for the worker's template cache
+    if (action === 'templates' && req.method === 'GET') {
+      const ids = String(req.query.ids || '')
+        .split(',')
+        .map((id: string) => id.trim())
+        .filter(Boolean);
+
+      if (ids.length === 0) {
+        return res.status(400).json({ error: 'ids required' });
+      }
+      if (ids.length > 500) {
+        return res.status(400).json({ error: 'At most 500 ids per request' });
+      }
+
+      const result = await mcp__supabase__execute_sql({
+        query: `
+          SELECT id, version, text_md
+          FROM msg_templates
+          WHERE id IN (${ids.map((id: string) => `${sqlString(id)}::uuid`).join(',')})
+        `
+      });
+
       return res.json({
-        jobs: result.rows || [],
+        templates: result.rows || [],
         count: result.rows?.length || 0
       });
     }
 
-    // Worker heartbeat
+    // Worker heartbeat. A full heartbeat replaces active_accounts and stats;
+    // a delta one ({ delta: true }) only carries what changed since the last
+    // heartbeat: account set diffs, counter increments and changed fields
     if (action === 'heartbeat' && req.method === 'POST') {
       const {
         worker_id,
         hostname,
         version = '1.0.0',
+        delta = false,
         active_accounts = [],
-        stats = {}
+        stats = {},
+        accounts_added = [],
+        accounts_removed = [],
+        stats_delta = {},
+        stats_set = {}
       } = req.body;
 
-      if (!worker_id || !hostname) {
+      if (!worker_id || (!delta && !hostname)) {
         return res.status(400).json({ error: 'worker_id and hostname required' });
       }
 
-      const query = `
-        INSERT INTO worker_heartbeats (
-          worker_id, hostname, version, status, active_accounts, stats, last_heartbeat_at
-        ) VALUES (
-          '${worker_id}', '${hostname}', '${version}', 'online',
-          '${JSON.stringify(active_accounts)}'::jsonb,
-          '${JSON.stringify(stats)}'::jsonb,
-          now()
-        )
-        ON CONFLICT (worker_id)
-        DO UPDATE SET
-          hostname = EXCLUDED.hostname,
-          version = EXCLUDED.version,
-          status = 'online',
-          active_accounts = EXCLUDED.active_accounts,
-          stats = EXCLUDED.stats,
-          last_heartbeat_at = now()
-        RETURNING worker_id, status, last_heartbeat_at
-      `;
+      const jsonb = (value: any) => `${sqlString(JSON.stringify(value))}::jsonb`;
+
+      const query = delta
+        ? `
+          UPDATE worker_heartbeats h
+          SET
+            status = 'online',
+            active_accounts = (
+              SELECT COALESCE(jsonb_agg(DISTINCT account), '[]'::jsonb)
+              FROM (
+                SELECT account
+                FROM jsonb_array_elements_text(h.active_accounts) AS account
+                WHERE NOT ${jsonb(accounts_removed)} ? account
+                UNION
+                SELECT jsonb_array_elements_text(${jsonb(accounts_added)})
+              ) accounts
+            ),
+            stats = h.stats || ${jsonb(stats_set)} || COALESCE((
+              SELECT jsonb_object_agg(
+                d.key,
+                to_jsonb(COALESCE((h.stats->>d.key)::numeric, 0) + (d.value #>> '{}')::numeric)
+              )
+              FROM jsonb_each(${jsonb(stats_delta)}) d
+            ), '{}'::jsonb),
+            last_heartbeat_at = now()
+          WHERE h.worker_id = ${sqlString(worker_id)}
+          RETURNING worker_id, status, last_heartbeat_at
+        `
+        : `
+          INSERT INTO worker_heartbeats (
+            worker_id, hostname, version, status, active_accounts, stats, last_heartbeat_at
+          ) VALUES (
+            ${sqlString(worker_id)}, ${sqlString(hostname)}, ${sqlString(version)}, 'online',
+            ${jsonb(active_accounts)},
+            ${jsonb(stats)},
+            now()
+          )
+          ON CONFLICT (worker_id)
+          DO UPDATE SET
+            hostname = EXCLUDED.hostname,
+            version = EXCLUDED.version,
+            status = 'online',
+            active_accounts = EXCLUDED.active_accounts,
+            stats = EXCLUDED.stats,
+            last_heartbeat_at = now()
+          RETURNING worker_id, status, last_heartbeat_at
+        `;
 
       const result = await mcp__supabase__execute_sql({ query });
+
+      // A delta for a worker with no row yet can't be applied; ask for a full one
+      if (delta && (result.rows?.length || 0) === 0) {
+        return res.json({ worker_id, resync: true });
+      }
+
       return res.json(result.rows[0]);
     }
 
@@ -139,6 +379,10 @@ export default async function handler(req: any, res: any) {
         updates.push(`attempt_count = attempt_count + 1`);
       }
 
+      if (status !== 'assigned') {
+        updates.push(`lease_expires_at = NULL`);
+      }
+
       const query = `
         UPDATE jobs
         SET ${updates.join(', ')}
@@ -194,6 +438,7 @@ export default async function handler(req: any, res: any) {
               SET
                 status = 'queued',
                 worker_id = NULL,
+                lease_expires_at = NULL,
                 scheduled_for = now() + interval '5 minutes'
               WHERE id = '${job_id}'
             `
@@ -204,12 +449,115 @@ export default async function handler(req: any, res: any) {
       return res.json(result.rows[0]);
     }
 
+    // Bulk job status update: applies a batch of transitions in one statement
+    if (action === 'update-jobs' && req.method === 'POST') {
+      const { updates = [], worker_id } = req.body;
+
+      if (!Array.isArray(updates) || updates.length === 0) {
+        return res.status(400).json({ error: 'updates array required' });
+      }
+
+      if (!worker_id) {
+        return res.status(400).json({ error: 'worker_id required' });
+      }
+
+      if (updates.some((u: any) => !u || !u.job_id || !u.status)) {
+        return res.status(400).json({ error: 'each update requires job_id and status' });
+      }
+
+      if (updates.some((u: any) => !JOB_RESULT_STATUSES.includes(u.status))) {
+        return res.status(400).json({ error: `status must be one of ${JOB_RESULT_STATUSES.join(', ')}` });
+      }
+
+      const values = updates.map((u: any) => `(
+        ${sqlString(u.job_id)}::uuid,
+        ${sqlString(u.status)},
+        ${sqlString(u.error_message)},
+        ${u.status === 'running' || u.attempted ? 1 : 0}
+      )`).join(',');
+
+      // Mirrors update-job: 'running' bumps attempt_count, 'failed' is requeued
+      // or marked failed_permanent, and 'done' increments account counters.
+      // 'released' hands an unstarted assigned job back to the queue as-is.
+      // Workers retry failed flushes, so only jobs this worker holds (or that
+      // nobody holds) are updated, and a repeated 'done' is counted once.
+      const query = `
+        WITH u (id, status, error_message, attempt_inc) AS (
+          VALUES ${values}
+        ),
+        updated AS (
+          UPDATE jobs j
+          SET
+            status = CASE
+              WHEN u.status = 'failed' AND j.attempt_count + u.attempt_inc >= 3 THEN 'failed_permanent'
+              WHEN u.status IN ('failed', 'released') THEN 'queued'
+              ELSE u.status
+            END,
+            error_message = COALESCE(u.error_message, j.error_message),
+            attempt_count = j.attempt_count + u.attempt_inc,
+            worker_id = CASE
+              WHEN u.status = 'failed' AND j.attempt_count + u.attempt_inc < 3 THEN NULL
+              WHEN u.status = 'released' THEN NULL
+              ELSE j.worker_id
+            END,
+            scheduled_for = CASE
+              WHEN u.status = 'failed' AND j.attempt_count + u.attempt_inc < 3 THEN now() + interval '5 minutes'
+              ELSE j.scheduled_for
+            END,
+            lease_expires_at = CASE
+              WHEN u.status IN ('running', 'done', 'failed', 'released') THEN NULL
+              ELSE j.lease_expires_at
+            END,
+            claimed_at = CASE WHEN u.status = 'released' THEN NULL ELSE j.claimed_at END
+          FROM u, jobs prev
+          WHERE j.id = u.id
+            AND prev.id = j.id
+            -- A late result must not touch a job that was since claimed by another worker
+            AND (j.worker_id = ${sqlString(worker_id)} OR j.worker_id IS NULL)
+            -- A release only returns jobs that were never started
+            AND (u.status <> 'released' OR j.status = 'assigned')
+          RETURNING j.id, j.status, j.attempt_count, j.account_id,
+                    u.status AS reported_status, prev.status AS previous_status
+        ),
+        sent AS (
+          SELECT account_id, COUNT(*) AS n
+          FROM updated
+          WHERE reported_status = 'done' AND previous_status <> 'done' AND account_id IS NOT NULL
+          GROUP BY account_id
+        ),
+        accounts AS (
+          UPDATE tg_accounts a
+          SET
+            hourly_sent = a.hourly_sent + sent.n,
+            daily_sent = a.daily_sent + sent.n,
+            last_active_at = now(),
+            updated_at = now()
+          FROM sent
+          WHERE a.id = sent.account_id
+        ),
+        alive AS (
+          -- A result flush proves the worker is alive as well as a heartbeat does
+          UPDATE worker_heartbeats
+          SET status = 'online', last_heartbeat_at = now()
+          WHERE worker_id = ${sqlString(worker_id)}
+        )
+        SELECT id, status, attempt_count FROM updated
+      `;
+
+      const result = await mcp__supabase__execute_sql({ query });
+
+      return res.json({
+        jobs: result.rows || [],
+        count: result.rows?.length || 0
+      });
+    }
+
     // Update account status (for FloodWait, errors, etc.)
     if (action === 'update-account' && req.method === 'POST') {
-      const { account_id, status, error_message, flood_wait_until } = req.body;
+      const { account_id, session_key, status, error_message, flood_wait_until } = req.body;
 
-      if (!account_id) {
-        return res.status(400).json({ error: 'account_id required' });
+      if (!account_id && !session_key) {
+        return res.status(400).json({ error: 'account_id or session_key required' });
       }
 
       const updates: string[] = ['updated_at = now()'];
@@ -225,7 +573,7 @@ export default async function handler(req: any, res: any) {
       const query = `
         UPDATE tg_accounts
         SET ${updates.join(', ')}
-        WHERE id = '${account_id}'
+        WHERE ${account_id ? `id = '${account_id}'` : `session_key = ${sqlString(session_key)}`}
         RETURNING id, status, updated_at
       `;
 
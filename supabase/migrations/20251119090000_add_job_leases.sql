@@ -0,0 +1,37 @@
+/*
+  # Add Job Leases
+
+  ## Overview
+  Supports atomic job claiming in the `pending-jobs` worker action. Jobs are
+  selected, locked with `FOR UPDATE SKIP LOCKED`, assigned and returned in a
+  single statement, so concurrent workers never claim the same rows.
+
+  ## Changes to Existing Tables
+
+  ### `jobs` enhancements
+  - `claimed_at` - When the job was claimed (added if missing)
+  - `lease_expires_at` - When an unstarted claim lapses and the job may be
+    claimed again by another worker
+*/
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'jobs' AND column_name = 'claimed_at'
+  ) THEN
+    ALTER TABLE jobs ADD COLUMN claimed_at timestamptz;
+  END IF;
+
+  IF NOT EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_name = 'jobs' AND column_name = 'lease_expires_at'
+  ) THEN
+    ALTER TABLE jobs ADD COLUMN lease_expires_at timestamptz;
+  END IF;
+END $$;
+
+-- Lets the claim query find lapsed leases without scanning assigned jobs
+CREATE INDEX IF NOT EXISTS idx_jobs_lease_expires
+  ON jobs (lease_expires_at)
+  WHERE status = 'assigned';
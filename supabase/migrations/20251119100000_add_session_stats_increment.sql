@@ -0,0 +1,48 @@
+/*
+  # Atomic Session Script Stats Increments
+
+  ## Overview
+  Session scripts flush aggregated counters instead of one update per
+  message. `increment_session_script_stats` applies a flush as a single
+  upsert, so concurrent flushes add up without a read-modify-write round trip.
+
+  ## New Functions
+  - `increment_session_script_stats(p_session_id, p_messages_sent,
+    p_messages_failed, p_groups_targeted)` - Adds the sent/failed deltas,
+    sets `groups_targeted` when given, and returns the updated row
+
+  ## Security
+  The function runs as the caller (`SECURITY INVOKER`), so the
+  `session_script_stats` RLS policies apply: a caller can only create or
+  update stats for session folders it owns.
+*/
+
+CREATE OR REPLACE FUNCTION increment_session_script_stats(
+  p_session_id uuid,
+  p_messages_sent integer DEFAULT 0,
+  p_messages_failed integer DEFAULT 0,
+  p_groups_targeted integer DEFAULT NULL
+)
+RETURNS session_script_stats
+LANGUAGE plpgsql
+SECURITY INVOKER
+AS $$
+DECLARE
+  result session_script_stats;
+BEGIN
+  INSERT INTO session_script_stats (
+    session_id, messages_sent, messages_failed, groups_targeted, updated_at
+  ) VALUES (
+    p_session_id, p_messages_sent, p_messages_failed, COALESCE(p_groups_targeted, 0), now()
+  )
+  ON CONFLICT (session_id)
+  DO UPDATE SET
+    messages_sent = session_script_stats.messages_sent + EXCLUDED.messages_sent,
+    messages_failed = session_script_stats.messages_failed + EXCLUDED.messages_failed,
+    groups_targeted = COALESCE(p_groups_targeted, session_script_stats.groups_targeted),
+    updated_at = now()
+  RETURNING * INTO result;
+
+  RETURN result;
+END;
+$$;
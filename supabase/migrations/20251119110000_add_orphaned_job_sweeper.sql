@@ -0,0 +1,150 @@
+/*
+  # Orphaned Job Sweeper
+
+  ## Overview
+  Jobs a worker claimed (`assigned`) or started (`running`) stay with that
+  worker until it reports back. If the worker crashes they are never returned.
+  `sweep_orphaned_jobs` hands them back in bulk: jobs of workers whose
+  heartbeat is stale, and jobs whose claim is older than a threshold,
+  whatever worker holds them.
+
+  Each pass touches at most `p_batch_size` rows and finds them through
+  partial indexes over in-flight jobs only, so it can run every few seconds
+  regardless of how many queued or finished jobs the table holds.
+
+  ## New Functions
+  - `sweep_orphaned_jobs(p_stale_after_sec, p_max_claim_age_sec,
+    p_max_attempts, p_batch_size)` - Marks stale workers offline, requeues
+    their jobs and over-age claims, and fails jobs that already used
+    `p_max_attempts` attempts. Returns the number of jobs requeued and failed
+
+  ## Changed Functions
+  - `reassign_orphaned_jobs()` - Now runs one sweep with the defaults, so the
+    attempt cap and batch limit apply to existing callers too
+
+  ## New Indexes
+  - `idx_jobs_claimed_in_flight` - `claimed_at` of assigned/running jobs
+  - `idx_jobs_worker_in_flight` - `worker_id` of assigned/running jobs
+
+  ## Security
+  Both functions are `SECURITY DEFINER`, so EXECUTE is revoked from
+  `PUBLIC`, `anon` and `authenticated` and granted to `service_role` only.
+  The thresholds are also floored inside the function: a heartbeat can be
+  skipped for up to `heartbeat_max_skip_sec` (150s by default), so a worker
+  is only considered stale after 300s, and a claim is only over-age after
+  3600s, the longest lease `pending-jobs` hands out.
+
+  ## Scheduling
+  With pg_cron (1.5+ for second intervals) the sweep is scheduled every
+  10 seconds. Without it, run `SELECT sweep_orphaned_jobs()` from another
+  scheduler connected as `service_role`. There is no HTTP action for it:
+  worker tokens are not verified strongly enough to gate a privileged
+  function.
+*/
+
+CREATE INDEX IF NOT EXISTS idx_jobs_claimed_in_flight
+  ON jobs (claimed_at)
+  WHERE status IN ('assigned', 'running');
+
+CREATE INDEX IF NOT EXISTS idx_jobs_worker_in_flight
+  ON jobs (worker_id)
+  WHERE status IN ('assigned', 'running');
+
+-- Lets the stale-worker lookup range-scan heartbeats instead of reading them all
+CREATE INDEX IF NOT EXISTS idx_worker_heartbeats_last_heartbeat
+  ON worker_heartbeats (last_heartbeat_at);
+
+CREATE OR REPLACE FUNCTION sweep_orphaned_jobs(
+  p_stale_after_sec integer DEFAULT 300,
+  p_max_claim_age_sec integer DEFAULT 3600,
+  p_max_attempts integer DEFAULT 3,
+  p_batch_size integer DEFAULT 1000
+)
+RETURNS TABLE (requeued integer, failed integer)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  -- Never reclaim from a worker that may still be alive or a lease that may still be live
+  p_stale_after_sec := LEAST(GREATEST(COALESCE(p_stale_after_sec, 300), 300), 86400);
+  p_max_claim_age_sec := LEAST(GREATEST(COALESCE(p_max_claim_age_sec, 3600), 3600), 7 * 86400);
+  p_max_attempts := LEAST(GREATEST(COALESCE(p_max_attempts, 3), 1), 100);
+  p_batch_size := LEAST(GREATEST(COALESCE(p_batch_size, 1000), 1), 10000);
+
+  -- Heartbeats may be skipped while job updates prove liveness, and
+  -- update-jobs refreshes last_heartbeat_at, so staleness is by timestamp only
+  UPDATE worker_heartbeats
+  SET status = 'offline'
+  WHERE status = 'online'
+    AND last_heartbeat_at < now() - make_interval(secs => p_stale_after_sec);
+
+  RETURN QUERY
+  WITH stale_workers AS (
+    SELECT worker_id
+    FROM worker_heartbeats
+    WHERE last_heartbeat_at < now() - make_interval(secs => p_stale_after_sec)
+  ),
+  candidates AS (
+    SELECT j.id
+    FROM jobs j
+    JOIN stale_workers w ON w.worker_id = j.worker_id
+    WHERE j.status IN ('assigned', 'running')
+    UNION
+    SELECT j.id
+    FROM jobs j
+    WHERE j.status IN ('assigned', 'running')
+      AND j.claimed_at < now() - make_interval(secs => p_max_claim_age_sec)
+  ),
+  orphaned AS (
+    SELECT j.id
+    FROM jobs j
+    WHERE j.id IN (SELECT id FROM candidates)
+      AND j.status IN ('assigned', 'running')
+    LIMIT p_batch_size
+    FOR UPDATE OF j SKIP LOCKED
+  ),
+  swept AS (
+    UPDATE jobs j
+    SET
+      -- 'running' already counted its attempt; don't retry past the cap
+      status = CASE WHEN j.attempt_count >= p_max_attempts THEN 'failed_permanent' ELSE 'queued' END,
+      error_message = 'Reclaimed from unresponsive worker ' || COALESCE(j.worker_id, 'unknown'),
+      worker_id = NULL,
+      claimed_at = NULL,
+      lease_expires_at = NULL
+    FROM orphaned o
+    WHERE j.id = o.id
+    RETURNING j.status
+  )
+  SELECT
+    COUNT(*) FILTER (WHERE swept.status = 'queued')::integer,
+    COUNT(*) FILTER (WHERE swept.status = 'failed_permanent')::integer
+  FROM swept;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION reassign_orphaned_jobs()
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  PERFORM sweep_orphaned_jobs();
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION sweep_orphaned_jobs(integer, integer, integer, integer) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION reassign_orphaned_jobs() FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION sweep_orphaned_jobs(integer, integer, integer, integer) TO service_role;
+GRANT EXECUTE ON FUNCTION reassign_orphaned_jobs() TO service_role;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+    BEGIN
+      PERFORM cron.schedule('sweep-orphaned-jobs', '10 seconds', 'SELECT sweep_orphaned_jobs()');
+    EXCEPTION WHEN others THEN
+      RAISE NOTICE 'pg_cron could not schedule sweep_orphaned_jobs: %', SQLERRM;
+    END;
+  END IF;
+END $$;
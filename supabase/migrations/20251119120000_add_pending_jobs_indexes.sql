@@ -0,0 +1,83 @@
+/*
+  # Pending-Jobs Claim Indexes and Account Eligibility
+
+  ## Overview
+  The `pending-jobs` claim walks jobs in `scheduled_for` order and filters
+  each one on its account's active flag, cooldown and hourly/daily limits.
+  With only `idx_jobs_scheduled (status, scheduled_for)` the planner has to
+  read through every non-queued row prefix and evaluate four account
+  conditions per job.
+
+  This migration folds the account checks into one maintained column,
+  `tg_accounts.eligible_at`. The account is claimable once `eligible_at < now()`.
+  It is `infinity` while the account is inactive or at a send limit, and
+  the cooldown end otherwise. Partial indexes over queued jobs let both claim
+  forms (global order and per-account lanes) stop after `LIMIT` index entries.
+
+  ## Changes to Existing Tables
+
+  ### `tg_accounts`
+  - `eligible_at` - Maintained by the `tg_accounts_eligible_at` trigger
+    whenever `is_active`, `last_cooldown_until` or a send counter/limit
+    changes. Counter resets (`reset_hourly_counters`, `reset_daily_counters`)
+    update the counters and so re-open the account
+
+  ## New Views
+  - `eligible_accounts` - Accounts that may be claimed for right now
+
+  ## New Indexes
+  - `idx_jobs_queued_schedule` - Queued jobs in `scheduled_for` order,
+    covering `account_id` and `session_key`
+  - `idx_jobs_queued_account` - Queued jobs per account in `scheduled_for`
+    order, for `per_session_limit` claims
+  - `idx_tg_accounts_eligible_at` - Eligible accounts by `eligible_at`
+
+  ## Notes
+  Indexes are built inside the migration transaction; on a large live table
+  create them `CONCURRENTLY` by hand first and this migration will skip them.
+*/
+
+ALTER TABLE tg_accounts ADD COLUMN IF NOT EXISTS eligible_at timestamptz;
+
+CREATE OR REPLACE FUNCTION set_tg_account_eligible_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- Same conditions pending-jobs used to check per job; NULL limits mean unlimited
+  NEW.eligible_at := CASE
+    WHEN NEW.is_active = false
+      OR NEW.hourly_sent >= NEW.hourly_limit
+      OR NEW.daily_sent >= NEW.daily_limit
+      THEN 'infinity'::timestamptz
+    ELSE COALESCE(NEW.last_cooldown_until, '-infinity'::timestamptz)
+  END;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS tg_accounts_eligible_at ON tg_accounts;
+CREATE TRIGGER tg_accounts_eligible_at
+  BEFORE INSERT OR UPDATE OF is_active, last_cooldown_until, hourly_sent, hourly_limit, daily_sent, daily_limit
+  ON tg_accounts
+  FOR EACH ROW
+  EXECUTE FUNCTION set_tg_account_eligible_at();
+
+-- Backfill through the trigger
+UPDATE tg_accounts SET last_cooldown_until = last_cooldown_until;
+
+CREATE INDEX IF NOT EXISTS idx_tg_accounts_eligible_at
+  ON tg_accounts (eligible_at) INCLUDE (session_key);
+
+CREATE OR REPLACE VIEW eligible_accounts AS
+  SELECT id, session_key, eligible_at
+  FROM tg_accounts
+  WHERE eligible_at < now();
+
+CREATE INDEX IF NOT EXISTS idx_jobs_queued_schedule
+  ON jobs (scheduled_for) INCLUDE (account_id, session_key)
+  WHERE status = 'queued';
+
+CREATE INDEX IF NOT EXISTS idx_jobs_queued_account
+  ON jobs (account_id, scheduled_for)
+  WHERE status = 'queued';
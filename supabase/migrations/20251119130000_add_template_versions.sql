@@ -0,0 +1,41 @@
+/*
+  # Template Versions
+
+  ## Overview
+  `pending-jobs` used to join the full template body into every claimed job,
+  so a campaign fanned out to thousands of chats shipped the same text
+  thousands of times. Jobs now carry `template_id` and `version` only, and
+  workers fetch bodies they haven't cached through the `templates` action.
+
+  `version` is what lets a worker trust its cache: it is bumped whenever the
+  content a message is built from changes, so a job referencing a newer
+  version than the cached one forces a refetch.
+
+  ## Changes to Existing Tables
+
+  ### `msg_templates`
+  - `version` - Starts at 1, incremented by the `msg_templates_version`
+    trigger on every update of `text_md`, `buttons_json` or `media_url`
+*/
+
+ALTER TABLE msg_templates ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION bump_msg_template_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF (NEW.text_md, NEW.buttons_json, NEW.media_url)
+      IS DISTINCT FROM (OLD.text_md, OLD.buttons_json, OLD.media_url) THEN
+    NEW.version := OLD.version + 1;
+  END IF;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS msg_templates_version ON msg_templates;
+CREATE TRIGGER msg_templates_version
+  BEFORE UPDATE OF text_md, buttons_json, media_url
+  ON msg_templates
+  FOR EACH ROW
+  EXECUTE FUNCTION bump_msg_template_version();
@@ -0,0 +1,283 @@
+"""
+In-process stand-in for the /worker and /sessions endpoints.
+
+Implements the same request/response contract as api/worker.ts and
+api/sessions.ts against an in-memory job table, and counts every call per
+action so benchmarks can report HTTP round trips per job.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from api_client import TGMarketerAPIClient
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY_SEC = 300
+LONG_POLL_PROBE_SEC = 0.5
+MAX_LONG_POLL_MS = 30000
+# Same projection as COLUMNAR_JOB_COLUMNS in api/worker.ts
+COLUMNAR_JOB_COLUMNS = ('id', 'account_id', 'session_key', 'chat_id', 'template_id', 'template_version',
+                        'hourly_sent', 'hourly_limit', 'daily_sent', 'daily_limit')
+
+
+class FakeWorkerAPI:
+    def __init__(self, sessions: Dict[str, List[int]], jobs_per_chat: int = 1,
+                 template_text: str = "Hello from the benchmark"):
+        self.calls = Counter()
+        # Uncompressed JSON response size per action
+        self.response_bytes = Counter()
+        self.templates: Dict[str, Dict[str, Any]] = {
+            'tpl-bench': {'id': 'tpl-bench', 'version': 1, 'text_md': template_text}
+        }
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.order: List[str] = []
+        self.accounts: Dict[str, Dict[str, Any]] = {}
+        self.heartbeats: List[Dict[str, Any]] = []
+        self.workers: Dict[str, Dict[str, Any]] = {}
+        self.session_logs = 0
+        self.session_stats: Dict[str, Dict[str, int]] = {}
+
+        for session_key, chat_ids in sessions.items():
+            account_id = f"acc-{session_key}"
+            self.accounts[account_id] = {'id': account_id, 'session_key': session_key,
+                                         'hourly_sent': 0, 'daily_sent': 0, 'cooldown_until': None}
+            for chat_id in chat_ids:
+                for _ in range(jobs_per_chat):
+                    job_id = str(uuid.uuid4())
+                    self.jobs[job_id] = {
+                        'id': job_id,
+                        'campaign_id': 'camp-bench',
+                        'account_id': account_id,
+                        'session_key': session_key,
+                        'chat_id': chat_id,
+                        'chat_id_bigint': chat_id,
+                        'template_id': 'tpl-bench',
+                        'status': 'queued',
+                        'attempt_count': 0,
+                        'scheduled_for': 0.0,
+                        'lease_expires_at': None,
+                        'hourly_sent': 0,
+                        'hourly_limit': None,
+                        'daily_sent': 0,
+                        'daily_limit': None,
+                    }
+                    self.order.append(job_id)
+
+    @property
+    def total_jobs(self) -> int:
+        return len(self.jobs)
+
+    def count_status(self, *statuses: str) -> int:
+        return sum(1 for job in self.jobs.values() if job['status'] in statuses)
+
+    def is_drained(self) -> bool:
+        return self.count_status('done', 'failed_permanent') == self.total_jobs
+
+    async def handle(self, method: str, endpoint: str, params: Dict[str, Any],
+                     body: Optional[Dict[str, Any]]) -> Any:
+        endpoint = endpoint.strip('/')
+        if endpoint == 'worker':
+            action = params.get('action')
+            self.calls[f"worker:{action}"] += 1
+            handler = getattr(self, f"_worker_{str(action).replace('-', '_')}", None)
+        elif endpoint == 'sessions':
+            action = (body or {}).get('action') or params.get('action')
+            self.calls[f"sessions:{action}"] += 1
+            handler = getattr(self, f"_sessions_{str(action).replace('-', '_')}", None)
+        else:
+            self.calls[endpoint] += 1
+            handler = None
+
+        if handler is None:
+            raise ValueError(f"Unsupported fake endpoint {method} {endpoint} {params}")
+        result = await handler(params, body or {})
+        self.response_bytes[f"{endpoint}:{action}"] += len(json.dumps(result, separators=(',', ':')))
+        return result
+
+    # /worker
+
+    def _claimable(self, now: float, excluded: set, per_session: Optional[int] = None) -> List[Dict[str, Any]]:
+        claimable = []
+        per_account = Counter()
+        for job_id in self.order:
+            job = self.jobs[job_id]
+            if job['session_key'] in excluded:
+                continue
+            account = self.accounts[job['account_id']]
+            if account['cooldown_until'] and account['cooldown_until'] > now:
+                continue
+            if per_session and per_account[job['account_id']] >= per_session:
+                continue
+            if ((job['status'] == 'queued' and job['scheduled_for'] <= now)
+                    or (job['status'] == 'assigned' and job['lease_expires_at'] < now)):
+                claimable.append(job)
+                per_account[job['account_id']] += 1
+        return claimable
+
+    async def _worker_pending_jobs(self, params, body):
+        limit = min(max(int(params.get('limit', 10)), 1), 500)
+        lease_sec = min(max(int(params.get('lease_sec', 300)), 10), 3600)
+        wait_ms = min(max(int(params.get('wait_ms', 0)), 0), MAX_LONG_POLL_MS)
+        excluded = set(filter(None, str(params.get('exclude_sessions', '')).split(',')))
+        per_session = params.get('per_session_limit')
+        per_session = min(max(int(per_session), 1), limit) if per_session else None
+
+        deadline = time.monotonic() + wait_ms / 1000
+        while True:
+            now = time.monotonic()
+            claimable = self._claimable(now, excluded, per_session)[:limit]
+            if claimable or now >= deadline or self.is_drained():
+                break
+            await asyncio.sleep(min(LONG_POLL_PROBE_SEC, deadline - now))
+
+        # Inlined unless the worker opts out, as in api/worker.ts
+        inline_templates = str(params.get('inline_templates', '1')) not in ('0', 'false')
+        rows = []
+        for job in claimable:
+            job['status'] = 'assigned'
+            job['worker_id'] = params.get('worker_id')
+            job['lease_expires_at'] = now + lease_sec
+            account = self.accounts[job['account_id']]
+            template = self.templates[job['template_id']]
+            row = {**job, 'hourly_sent': account['hourly_sent'], 'daily_sent': account['daily_sent'],
+                   'template_version': template['version']}
+            if inline_templates:
+                row['template_text'] = template['text_md']
+            rows.append(row)
+
+        if params.get('format') == 'columnar':
+            columns = list(COLUMNAR_JOB_COLUMNS)
+            if inline_templates:
+                columns.append('template_text')
+            return {'format': 'columnar', 'columns': columns,
+                    'data': [[row.get(column) for row in rows] for column in columns], 'count': len(rows)}
+        return {'jobs': rows, 'count': len(rows)}
+
+    async def _worker_templates(self, params, body):
+        ids = [template_id for template_id in str(params.get('ids', '')).split(',') if template_id]
+        if not ids or len(ids) > 500:
+            raise ValueError(f"templates needs 1-500 ids, got {len(ids)}")
+        rows = [dict(self.templates[template_id]) for template_id in ids if template_id in self.templates]
+        return {'templates': rows, 'count': len(rows)}
+
+    def _apply_transition(self, update: Dict[str, Any],
+                          worker_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(update.get('job_id'))
+        if not job:
+            return None
+        # update-jobs only touches jobs the caller holds, or that nobody holds
+        if worker_id and job.get('worker_id') not in (None, worker_id):
+            return None
+
+        status = update['status']
+        previous = job['status']
+        if status == 'released' and previous != 'assigned':
+            return None
+
+        attempt_inc = 1 if status == 'running' or update.get('attempted') else 0
+        job['attempt_count'] += attempt_inc
+        job['lease_expires_at'] = None
+        if update.get('error_message'):
+            job['error_message'] = update['error_message']
+
+        if status == 'failed':
+            if job['attempt_count'] >= MAX_ATTEMPTS:
+                job['status'] = 'failed_permanent'
+            else:
+                job['status'] = 'queued'
+                job['worker_id'] = None
+                job['scheduled_for'] = time.monotonic() + RETRY_DELAY_SEC
+        elif status == 'released':
+            job['status'] = 'queued'
+            job['worker_id'] = None
+        else:
+            job['status'] = status
+
+        if status == 'done' and previous != 'done':
+            account = self.accounts[job['account_id']]
+            account['hourly_sent'] += 1
+            account['daily_sent'] += 1
+
+        return {'id': job['id'], 'status': job['status'], 'attempt_count': job['attempt_count']}
+
+    async def _worker_update_job(self, params, body):
+        return self._apply_transition(body) or {'error': 'Job not found'}
+
+    async def _worker_update_jobs(self, params, body):
+        worker_id = body.get('worker_id')
+        rows = [row for row in (self._apply_transition(update, worker_id) for update in body.get('updates', []))
+                if row]
+        return {'jobs': rows, 'count': len(rows)}
+
+    async def _worker_update_account(self, params, body):
+        account_id = body.get('account_id') or f"acc-{body.get('session_key')}"
+        account = self.accounts.get(account_id)
+        if account and body.get('flood_wait_until'):
+            # The worker's own cooldown index is authoritative in simulated time
+            account['cooldown_until'] = None
+        return {'id': account_id, 'status': body.get('status')}
+
+    async def _worker_heartbeat(self, params, body):
+        self.heartbeats.append(body)
+        worker_id = body.get('worker_id')
+        if not body.get('delta'):
+            self.workers[worker_id] = {'active_accounts': set(body.get('active_accounts', [])),
+                                       'stats': dict(body.get('stats', {}))}
+            return {'worker_id': worker_id, 'status': 'online'}
+
+        worker = self.workers.get(worker_id)
+        if worker is None:
+            return {'worker_id': worker_id, 'resync': True}
+        worker['active_accounts'] -= set(body.get('accounts_removed', []))
+        worker['active_accounts'] |= set(body.get('accounts_added', []))
+        worker['stats'].update(body.get('stats_set', {}))
+        for key, value in body.get('stats_delta', {}).items():
+            worker['stats'][key] = worker['stats'].get(key, 0) + value
+        return {'worker_id': worker_id, 'status': 'online'}
+
+    async def _worker_stats(self, params, body):
+        return {'pending_jobs': [{'count': self.count_status('queued')}]}
+
+    # /sessions
+
+    async def _sessions_log(self, params, body):
+        self.session_logs += 1
+        return {'log': {'session_id': body.get('session_id')}}
+
+    async def _sessions_log_batch(self, params, body):
+        logs = body.get('logs') or []
+        self.session_logs += len(logs)
+        return {'count': len(logs)}
+
+    async def _sessions_update_stats(self, params, body):
+        stats = self.session_stats.setdefault(body.get('session_id'), Counter())
+        stats['messages_sent'] += body.get('messages_sent') or 0
+        stats['messages_failed'] += body.get('messages_failed') or 0
+        return {'stats': dict(stats)}
+
+
+class BenchAPIClient(TGMarketerAPIClient):
+    """TGMarketerAPIClient whose transport is the in-process fake, with simulated latency."""
+
+    def __init__(self, fake_api: FakeWorkerAPI, worker_id: str, api_latency_sec: float = 0.02,
+                 row_format: bool = False):
+        super().__init__('http://bench.invalid/api', 'bench-token', worker_id)
+        self.fake_api = fake_api
+        self.api_latency_sec = api_latency_sec
+        # Ask for the verbose row format, as a worker without the columnar decoder would
+        self.row_format = row_format
+
+    async def _request(self, method: str, endpoint: str, timeout: Optional[float] = None,
+                       max_retries: int = 3, **kwargs) -> Optional[Dict]:
+        await asyncio.sleep(self.api_latency_sec)
+        params = dict(kwargs.get('params') or {})
+        if self.row_format:
+            params.pop('format', None)
+        return await self.fake_api.handle(method, endpoint, params, kwargs.get('json'))
+
+    async def close(self):
+        pass
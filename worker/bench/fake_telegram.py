@@ -0,0 +1,120 @@
+"""
+Fake Telethon client with configurable RPC latency and error injection.
+"""
+
+import asyncio
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+from telethon import utils
+from telethon.errors import FloodWaitError, ChatWriteForbiddenError
+from telethon.tl.types import InputPeerChannel
+
+
+@dataclass
+class TelegramProfile:
+    rpc_latency_sec: float = 0.08
+    connect_latency_sec: float = 0.3
+    flood_wait_rate: float = 0.0
+    flood_wait_sec: int = 30
+    write_forbidden_rate: float = 0.0
+    disconnect_rate: float = 0.0
+    reconnect_fail_rate: float = 0.0
+    seed: int = 1
+
+
+class FakeTelegramClient:
+    # Shared across instances so every client draws from one reproducible sequence
+    profile = TelegramProfile()
+    rng = random.Random(1)
+    dialogs: Dict[str, List[int]] = {}
+    counters = {'connects': 0, 'sends': 0, 'flood_waits': 0, 'write_forbidden': 0, 'dialog_walks': 0,
+                'drops': 0, 'failed_connects': 0}
+
+    @classmethod
+    def configure(cls, profile: TelegramProfile, dialogs: Dict[str, List[int]]):
+        cls.profile = profile
+        cls.rng = random.Random(profile.seed)
+        cls.dialogs = dialogs
+        cls.counters = {key: 0 for key in cls.counters}
+
+    def __init__(self, session, api_id, api_hash, **kwargs):
+        self.session_key = Path(str(session)).name
+        self.connected = False
+        self._disconnected = None
+
+    async def connect(self):
+        await asyncio.sleep(self.profile.connect_latency_sec)
+        reconnect = self._disconnected is not None
+        if reconnect and self.profile.reconnect_fail_rate and self.rng.random() < self.profile.reconnect_fail_rate:
+            self.counters['failed_connects'] += 1
+            raise ConnectionError("fake connect failure")
+        self.connected = True
+        self._disconnected = asyncio.get_running_loop().create_future()
+        self.counters['connects'] += 1
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    @property
+    def disconnected(self) -> asyncio.Future:
+        if self._disconnected is None:
+            self._disconnected = asyncio.get_running_loop().create_future()
+            self._disconnected.set_result(None)
+        return asyncio.shield(self._disconnected)
+
+    async def disconnect(self):
+        self._drop()
+
+    def _drop(self, error: Exception = None):
+        self.connected = False
+        if self._disconnected and not self._disconnected.done():
+            if error:
+                self._disconnected.set_exception(error)
+            else:
+                self._disconnected.set_result(None)
+
+    async def is_user_authorized(self) -> bool:
+        await asyncio.sleep(self.profile.rpc_latency_sec)
+        return True
+
+    async def get_me(self):
+        await asyncio.sleep(self.profile.rpc_latency_sec)
+        return SimpleNamespace(id=int(self.session_key) if self.session_key.isdigit() else 0,
+                               first_name=self.session_key)
+
+    async def send_message(self, entity, message, **kwargs):
+        if not self.connected:
+            raise ConnectionError("Cannot send requests while disconnected")
+        await asyncio.sleep(self.profile.rpc_latency_sec)
+
+        roll = self.rng.random()
+        if roll < self.profile.flood_wait_rate:
+            self.counters['flood_waits'] += 1
+            raise FloodWaitError(request=None, capture=self.profile.flood_wait_sec)
+        if roll < self.profile.flood_wait_rate + self.profile.write_forbidden_rate:
+            self.counters['write_forbidden'] += 1
+            raise ChatWriteForbiddenError(request=None)
+        if roll < self.profile.flood_wait_rate + self.profile.write_forbidden_rate + self.profile.disconnect_rate:
+            self.counters['drops'] += 1
+            error = ConnectionError("fake connection drop")
+            self._drop(error)
+            raise error
+
+        self.counters['sends'] += 1
+        # Telethon fills input_chat from the entities returned with the update
+        if isinstance(entity, int):
+            real_id, _ = utils.resolve_id(entity)
+            entity = InputPeerChannel(real_id, access_hash=real_id * 31)
+        return SimpleNamespace(id=self.counters['sends'], message=message, input_chat=entity)
+
+    async def iter_dialogs(self, *args, **kwargs):
+        self.counters['dialog_walks'] += 1
+        for chat_id in self.dialogs.get(self.session_key, []):
+            real_id, _ = utils.resolve_id(chat_id)
+            entity = InputPeerChannel(real_id, access_hash=real_id * 31)
+            yield SimpleNamespace(id=chat_id, entity=entity, title=f"chat {real_id}",
+                                  is_group=True, is_channel=True)
@@ -0,0 +1,301 @@
+"""
+Offline worker benchmark.
+
+Runs the real TGWorker + MessageSender pipeline against an in-process fake of
+the /worker and /sessions API and a fake Telethon client, on a virtual-time
+event loop. Reports simulated throughput, HTTP calls per job, event-loop lag
+and RSS per loaded session, and can compare against a saved baseline.
+
+Usage:
+    python bench/run_bench.py --sessions 20 --chats 25
+    python bench/run_bench.py --json bench_baseline.json
+    python bench/run_bench.py --compare bench_baseline.json --tolerance 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / 'src'))
+sys.path.insert(0, str(BENCH_DIR))
+
+import session_manager  # noqa: E402
+from main import TGWorker  # noqa: E402
+from fake_api import FakeWorkerAPI, BenchAPIClient  # noqa: E402
+from fake_telegram import FakeTelegramClient, TelegramProfile  # noqa: E402
+from virtual_clock import VirtualClock, VirtualClockLoop, patched_time  # noqa: E402
+
+# Metrics where a larger value is a regression
+LOWER_IS_BETTER = ('http_calls_per_job', 'cpu_ms_per_job', 'loop_lag_p99_ms', 'rss_kb_per_session')
+HIGHER_IS_BETTER = ('jobs_per_sec',)
+
+
+def current_rss_bytes():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def write_config(root: Path, args) -> Path:
+    config_path = root / 'config.toml'
+    config_path.write_text(f"""
+[server]
+tg_marketer_api_url = "http://bench.invalid/api"
+jwt_token = "bench-token"
+worker_id = "bench-worker"
+
+[worker]
+poll_interval_ms = 2000
+max_parallel_sessions = {args.parallel}
+warmup_sessions = {str(args.warmup).lower()}
+heartbeat_interval_sec = 30
+idle_timeout_sec = 300
+
+[sessions]
+root_dir = "{(root / 'sessions').as_posix()}"
+auto_discover = true
+session_extension = ".session"
+entity_cache_file = "{(root / 'state' / 'entity_cache.json').as_posix()}"
+manifest_file = "{(root / 'state' / 'session_manifest.json').as_posix()}"
+
+[sending]
+default_delay_min_sec = {args.delay_min}
+default_delay_max_sec = {args.delay_max}
+group_delay_sec = {args.group_delay}
+flood_wait_multiplier = 1.2
+max_retries = 3
+
+[limits]
+global_hourly_limit = 0
+global_daily_limit = 0
+state_file = "{(root / 'state' / 'rate_limits.json').as_posix()}"
+
+[logging]
+level = "{args.log_level}"
+file = "{(root / 'logs' / 'worker.log').as_posix()}"
+max_size_mb = 100
+backup_count = 5
+""")
+    return config_path
+
+
+def build_sessions(root: Path, session_count: int, chats_per_session: int) -> dict:
+    sessions = {}
+    for i in range(session_count):
+        session_key = f"98990{i:07d}"
+        folder = root / 'sessions' / session_key
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"{session_key}.session").touch()
+        # Marked channel ids (-100xxxxxxxxxx), unique per session
+        sessions[session_key] = [-(10 ** 12 + i * 100000 + j + 1) for j in range(chats_per_session)]
+    return sessions
+
+
+def install_api_client(worker, api_client):
+    # Every component that talks to the API keeps its own reference
+    worker.api_client = api_client
+    for component in vars(worker).values():
+        if hasattr(component, 'api_client'):
+            component.api_client = api_client
+
+
+async def lag_probe(samples: list, interval_sec: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval_sec)
+        started = time.perf_counter()
+        future = loop.create_future()
+        loop.call_soon(future.set_result, None)
+        await future
+        samples.append(time.perf_counter() - started)
+
+
+async def run_scenario(args, clock: VirtualClock) -> dict:
+    with tempfile.TemporaryDirectory(prefix='tg-worker-bench-') as tmp:
+        root = Path(tmp)
+        sessions = build_sessions(root, args.sessions, args.chats)
+        config_path = write_config(root, args)
+
+        FakeTelegramClient.configure(TelegramProfile(
+            rpc_latency_sec=args.rpc_latency_ms / 1000,
+            connect_latency_sec=args.connect_latency_ms / 1000,
+            flood_wait_rate=args.flood_rate,
+            flood_wait_sec=args.flood_wait_sec,
+            write_forbidden_rate=args.forbidden_rate,
+            disconnect_rate=args.drop_rate,
+            reconnect_fail_rate=args.reconnect_fail_rate,
+            seed=args.seed
+        ), sessions)
+        session_manager.TelegramClient = FakeTelegramClient
+
+        fake_api = FakeWorkerAPI(sessions, jobs_per_chat=args.jobs_per_chat)
+        rss_before = current_rss_bytes()
+
+        worker = TGWorker(str(config_path))
+        install_api_client(worker, BenchAPIClient(fake_api, worker.config.worker_id,
+                                                  api_latency_sec=args.api_latency_ms / 1000,
+                                                  row_format=args.row_format))
+
+        lag_samples = []
+        peak = {'clients': 0, 'rss': rss_before}
+
+        async def watch():
+            while not fake_api.is_drained() and clock.now < args.max_virtual_sec:
+                await asyncio.sleep(1)
+                peak['clients'] = max(peak['clients'], len(worker.session_manager.clients))
+            peak['rss'] = current_rss_bytes()
+            worker.running = False
+
+        virtual_started = clock.now
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+
+        probe = asyncio.create_task(lag_probe(lag_samples, args.lag_interval_ms / 1000))
+        watcher = asyncio.create_task(watch())
+        await worker.start()
+        await watcher
+        probe.cancel()
+
+        virtual_elapsed = clock.now - virtual_started
+        wall_elapsed = time.perf_counter() - wall_started
+        cpu_elapsed = time.process_time() - cpu_started
+
+    done = fake_api.count_status('done')
+    total_calls = sum(fake_api.calls.values())
+    lag_ms = sorted(sample * 1000 for sample in lag_samples) or [0.0]
+    rss_per_session = None
+    if rss_before and peak['rss'] and peak['clients']:
+        rss_per_session = (peak['rss'] - rss_before) / 1024 / peak['clients']
+
+    return {
+        'jobs_total': fake_api.total_jobs,
+        'jobs_done': done,
+        'jobs_failed_permanent': fake_api.count_status('failed_permanent'),
+        'drained': fake_api.is_drained(),
+        'virtual_sec': round(virtual_elapsed, 2),
+        'wall_sec': round(wall_elapsed, 3),
+        'jobs_per_sec': round(done / virtual_elapsed, 3) if virtual_elapsed else 0.0,
+        'cpu_ms_per_job': round(cpu_elapsed * 1000 / max(done, 1), 3),
+        'http_calls': total_calls,
+        'http_calls_per_job': round(total_calls / max(done, 1), 3),
+        'http_calls_by_action': dict(sorted(fake_api.calls.items())),
+        'pending_jobs_bytes_per_job': round(fake_api.response_bytes['worker:pending-jobs'] / max(done, 1), 1),
+        'loop_lag_p50_ms': round(statistics.median(lag_ms), 3),
+        'loop_lag_p99_ms': round(lag_ms[min(int(len(lag_ms) * 0.99), len(lag_ms) - 1)], 3),
+        'loop_lag_max_ms': round(lag_ms[-1], 3),
+        'sessions_loaded': peak['clients'],
+        'rss_kb_per_session': round(rss_per_session, 1) if rss_per_session is not None else None,
+        'telegram': dict(FakeTelegramClient.counters),
+    }
+
+
+def run(args) -> dict:
+    clock = VirtualClock()
+    loop = VirtualClockLoop(clock)
+    asyncio.set_event_loop(loop)
+    try:
+        with patched_time(clock):
+            return loop.run_until_complete(run_scenario(args, clock))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for key in LOWER_IS_BETTER:
+        if result.get(key) is not None and baseline.get(key):
+            if result[key] > baseline[key] * (1 + tolerance):
+                regressions.append(f"{key}: {baseline[key]} -> {result[key]}")
+    for key in HIGHER_IS_BETTER:
+        if result.get(key) is not None and baseline.get(key):
+            if result[key] < baseline[key] * (1 - tolerance):
+                regressions.append(f"{key}: {baseline[key]} -> {result[key]}")
+    return regressions
+
+
+def print_report(result: dict):
+    print("Worker benchmark")
+    print(f"  jobs:              {result['jobs_done']}/{result['jobs_total']} done, "
+          f"{result['jobs_failed_permanent']} failed permanently")
+    print(f"  simulated time:    {result['virtual_sec']}s ({result['wall_sec']}s wall)")
+    print(f"  throughput:        {result['jobs_per_sec']} jobs/sec (simulated)")
+    print(f"  cpu per job:       {result['cpu_ms_per_job']} ms")
+    print(f"  http calls/job:    {result['http_calls_per_job']} ({result['http_calls']} total)")
+    for action, count in result['http_calls_by_action'].items():
+        print(f"    {action:<28} {count}")
+    print(f"  pending-jobs:      {result['pending_jobs_bytes_per_job']} bytes/job (uncompressed JSON)")
+    print(f"  event-loop lag:    p50 {result['loop_lag_p50_ms']} ms, p99 {result['loop_lag_p99_ms']} ms, "
+          f"max {result['loop_lag_max_ms']} ms")
+    print(f"  sessions loaded:   {result['sessions_loaded']}")
+    print(f"  rss per session:   {result['rss_kb_per_session']} KB")
+    print(f"  telegram:          {result['telegram']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline TG Marketer worker benchmark")
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--chats', type=int, default=20, help="chats per session")
+    parser.add_argument('--jobs-per-chat', type=int, default=1)
+    parser.add_argument('--parallel', type=int, default=5, help="max_parallel_sessions")
+    parser.add_argument('--delay-min', type=float, default=2)
+    parser.add_argument('--delay-max', type=float, default=5)
+    parser.add_argument('--group-delay', type=float, default=12)
+    parser.add_argument('--rpc-latency-ms', type=float, default=80)
+    parser.add_argument('--connect-latency-ms', type=float, default=300)
+    parser.add_argument('--api-latency-ms', type=float, default=20)
+    parser.add_argument('--flood-rate', type=float, default=0.0)
+    parser.add_argument('--flood-wait-sec', type=int, default=30)
+    parser.add_argument('--forbidden-rate', type=float, default=0.0)
+    parser.add_argument('--row-format', action='store_true',
+                        help="fetch jobs in the verbose row format instead of columnar")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="connection drops per send")
+    parser.add_argument('--reconnect-fail-rate', type=float, default=0.0)
+    parser.add_argument('--lag-interval-ms', type=float, default=50)
+    parser.add_argument('--max-virtual-sec', type=float, default=7 * 86400)
+    parser.add_argument('--warmup', action='store_true', help="connect sessions before claiming jobs")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(args.log_level)
+
+    result = run(args)
+    print_report(result)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+
+    if args.compare:
+        regressions = compare(result, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
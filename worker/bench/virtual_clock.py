@@ -0,0 +1,90 @@
+"""
+Virtual-time event loop for benchmarks.
+
+Timers (asyncio.sleep, wait_for, call_later) fire in simulated time: whenever the
+loop has nothing ready to run, the clock jumps straight to the next timer instead
+of blocking. Configured send delays of minutes therefore cost microseconds of
+wall time, while CPU work done by the worker is still measured for real.
+"""
+
+import asyncio
+import selectors
+import time
+
+
+class VirtualClock:
+    def __init__(self, start: float = 0.0, epoch: float = None):
+        self.now = start
+        self.epoch = time.time() if epoch is None else epoch
+
+    def advance(self, seconds: float):
+        if seconds > 0:
+            self.now += seconds
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def wall(self) -> float:
+        return self.epoch + self.now
+
+
+class _VirtualSelector(selectors.BaseSelector):
+    """Polls real file descriptors without blocking and advances the clock instead."""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self.selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self.selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self.selector.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if events:
+            return events
+        if timeout is None:
+            # Nothing scheduled at all: wait briefly for real I/O (e.g. signals)
+            return self.selector.select(0.01)
+        self.clock.advance(timeout)
+        return []
+
+    def close(self):
+        self.selector.close()
+
+    def get_key(self, fileobj):
+        return self.selector.get_key(fileobj)
+
+    def get_map(self):
+        return self.selector.get_map()
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock = None):
+        self.clock = clock or VirtualClock()
+        super().__init__(selector=_VirtualSelector(self.clock))
+
+    def time(self) -> float:
+        return self.clock.now
+
+
+class patched_time:
+    """Point time.monotonic/time.time at the virtual clock for code outside asyncio."""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+
+    def __enter__(self):
+        self.saved = (time.monotonic, time.time)
+        time.monotonic = self.clock.monotonic
+        time.time = self.clock.wall
+        return self.clock
+
+    def __exit__(self, *exc):
+        time.monotonic, time.time = self.saved
+        return False
@@ -1,56 +1,122 @@
-import requests
-import time
+import asyncio
+import aiohttp
 import logging
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, Iterable
+
+from job import Job, decode_jobs
+from metrics import API_LATENCY
 
 logger = logging.getLogger(__name__)
 
 class TGMarketerAPIClient:
-    def __init__(self, api_url: str, jwt_token: str, worker_id: str):
+    def __init__(self, api_url: str, jwt_token: str, worker_id: str,
+                 request_timeout_sec: float = 10, connect_timeout_sec: float = 5,
+                 max_connections: int = 10, keepalive_timeout_sec: float = 60):
         self.api_url = api_url.rstrip('/')
         self.jwt_token = jwt_token
         self.worker_id = worker_id
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.request_timeout_sec = request_timeout_sec
+        self.connect_timeout_sec = connect_timeout_sec
+        self.max_connections = max_connections
+        self.keepalive_timeout_sec = keepalive_timeout_sec
+        self.headers = {
             'Authorization': f'Bearer {jwt_token}',
             'Content-Type': 'application/json'
-        })
+        }
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session binds to the running event loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout_sec
+            )
+            self.session = aiohttp.ClientSession(headers=self.headers, connector=connector)
+        return self.session
 
-    def _request(self, method: str, endpoint: str, **kwargs) -> Optional[Dict]:
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def _request(self, method: str, endpoint: str, timeout: Optional[float] = None,
+                       max_retries: int = 3, **kwargs) -> Optional[Dict]:
         url = f"{self.api_url}/{endpoint.lstrip('/')}"
-        max_retries = 3
+        client_timeout = aiohttp.ClientTimeout(
+            total=timeout or self.request_timeout_sec,
+            connect=self.connect_timeout_sec
+        )
+
+        action = (kwargs.get('params') or {}).get('action') or (kwargs.get('json') or {}).get('action')
+        action = f"{endpoint.strip('/')}:{action}" if action else endpoint.strip('/')
 
         for attempt in range(max_retries):
+            started = time.monotonic()
             try:
-                response = self.session.request(method, url, timeout=30, **kwargs)
-                response.raise_for_status()
-                return response.json()
-            except requests.exceptions.RequestException as e:
-                logger.error(f"API request failed (attempt {attempt + 1}/{max_retries}): {e}")
+                session = self._get_session()
+                async with session.request(method, url, timeout=client_timeout, **kwargs) as response:
+                    response.raise_for_status()
+                    result = await response.json(content_type=None)
+                API_LATENCY.observe(time.monotonic() - started, action)
+                return result
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                API_LATENCY.observe(time.monotonic() - started, action)
+                logger.error(f"API request failed (attempt {attempt + 1}/{max_retries}): {e!r}")
                 if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
+                    await asyncio.sleep(2 ** attempt)
                 else:
                     raise
 
         return None
 
-    def get_pending_jobs(self, limit: int = 10, account_id: Optional[str] = None) -> List[Dict]:
+    async def get_pending_jobs(self, limit: int = 10, account_id: Optional[str] = None,
+                               lease_sec: Optional[int] = None, wait_ms: int = 0,
+                               exclude_sessions: Optional[Iterable[str]] = None,
+                               per_session_limit: Optional[int] = None) -> Optional[List[Job]]:
+        """Claimed jobs; None when the request failed, so callers can tell it from an empty poll."""
+        # Columnar responses carry only the columns Job reads; large ones arrive gzipped.
+        # Template bodies come from the template cache rather than with every job
         params = {
             'action': 'pending-jobs',
             'limit': limit,
-            'worker_id': self.worker_id
+            'worker_id': self.worker_id,
+            'format': 'columnar',
+            'inline_templates': 0
         }
+        if lease_sec:
+            params['lease_sec'] = lease_sec
+        if wait_ms:
+            params['wait_ms'] = wait_ms
         if account_id:
             params['account_id'] = account_id
+        if exclude_sessions:
+            params['exclude_sessions'] = ','.join(sorted(exclude_sessions))
+        if per_session_limit:
+            params['per_session_limit'] = per_session_limit
 
         try:
-            result = self._request('GET', '/worker', params=params)
-            return result.get('jobs', []) if result else []
+            # A long-poll request may be held server-side for up to wait_ms
+            result = await self._request('GET', '/worker', params=params,
+                                         timeout=self.request_timeout_sec + wait_ms / 1000)
+            return decode_jobs(result)
         except Exception as e:
             logger.error(f"Failed to fetch pending jobs: {e}")
-            return []
+            return None
 
-    def update_job(self, job_id: str, status: str, error_message: Optional[str] = None, sent_at: Optional[str] = None) -> bool:
+    async def get_templates(self, template_ids: Iterable[str]) -> Optional[List[Dict]]:
+        """Template bodies by id; None when the request failed."""
+        params = {'action': 'templates', 'ids': ','.join(sorted(template_ids))}
+
+        try:
+            result = await self._request('GET', '/worker', params=params)
+            return result.get('templates', []) if result else None
+        except Exception as e:
+            logger.error(f"Failed to fetch templates: {e}")
+            return None
+
+    async def update_job(self, job_id: str, status: str, error_message: Optional[str] = None, sent_at: Optional[str] = None) -> bool:
         data = {
             'job_id': job_id,
             'status': status
@@ -61,16 +127,30 @@ class TGMarketerAPIClient:
             data['sent_at'] = sent_at
 
         try:
-            result = self._request('POST', '/worker?action=update-job', json=data)
+            result = await self._request('POST', '/worker', params={'action': 'update-job'}, json=data)
             return result is not None
         except Exception as e:
             logger.error(f"Failed to update job {job_id}: {e}")
             return False
 
-    def update_account(self, account_id: str, status: Optional[str] = None,
-                       error_message: Optional[str] = None,
-                       flood_wait_until: Optional[str] = None) -> bool:
-        data = {'account_id': account_id}
+    async def update_jobs(self, updates: List[Dict[str, Any]]) -> bool:
+        if not updates:
+            return True
+
+        try:
+            result = await self._request('POST', '/worker', params={'action': 'update-jobs'},
+                                         json={'updates': updates, 'worker_id': self.worker_id})
+            return result is not None
+        except Exception as e:
+            logger.error(f"Failed to update {len(updates)} job(s): {e}")
+            return False
+
+    async def update_account(self, account_id: Optional[str], status: Optional[str] = None,
+                             error_message: Optional[str] = None,
+                             flood_wait_until: Optional[str] = None,
+                             session_key: Optional[str] = None) -> bool:
+        # Accounts can be addressed by local session key when the id isn't known
+        data = {'account_id': account_id} if account_id else {'session_key': session_key}
         if status:
             data['status'] = status
         if error_message:
@@ -79,13 +159,13 @@ class TGMarketerAPIClient:
             data['flood_wait_until'] = flood_wait_until
 
         try:
-            result = self._request('POST', '/worker?action=update-account', json=data)
+            result = await self._request('POST', '/worker', params={'action': 'update-account'}, json=data)
             return result is not None
         except Exception as e:
-            logger.error(f"Failed to update account {account_id}: {e}")
+            logger.error(f"Failed to update account {account_id or session_key}: {e}")
             return False
 
-    def send_heartbeat(self, hostname: str, version: str, active_accounts: List[str], stats: Dict[str, Any]) -> bool:
+    async def send_heartbeat(self, hostname: str, version: str, active_accounts: List[str], stats: Dict[str, Any]) -> bool:
         data = {
             'worker_id': self.worker_id,
             'hostname': hostname,
@@ -95,22 +175,42 @@ class TGMarketerAPIClient:
         }
 
         try:
-            result = self._request('POST', '/worker?action=heartbeat', json=data)
+            # Heartbeats are periodic, so a slow API should not hold the loop for retries
+            result = await self._request('POST', '/worker', params={'action': 'heartbeat'},
+                                         json=data, max_retries=1)
             return result is not None
         except Exception as e:
             logger.error(f"Failed to send heartbeat: {e}")
             return False
 
-    def get_stats(self) -> Optional[Dict]:
+    async def send_heartbeat_delta(self, accounts_added: List[str], accounts_removed: List[str],
+                                   stats_delta: Dict[str, Any], stats_set: Dict[str, Any]) -> Optional[Dict]:
+        data = {
+            'worker_id': self.worker_id,
+            'delta': True,
+            'accounts_added': accounts_added,
+            'accounts_removed': accounts_removed,
+            'stats_delta': stats_delta,
+            'stats_set': stats_set
+        }
+
+        try:
+            return await self._request('POST', '/worker', params={'action': 'heartbeat'},
+                                       json=data, max_retries=1)
+        except Exception as e:
+            logger.error(f"Failed to send heartbeat delta: {e}")
+            return None
+
+    async def get_stats(self) -> Optional[Dict]:
         try:
-            return self._request('GET', f'/worker?action=stats&worker_id={self.worker_id}')
+            return await self._request('GET', '/worker', params={'action': 'stats', 'worker_id': self.worker_id})
         except Exception as e:
             logger.error(f"Failed to fetch stats: {e}")
             return None
 
-    def list_accounts(self) -> List[Dict]:
+    async def list_accounts(self) -> List[Dict]:
         try:
-            result = self._request('GET', '/accounts')
+            result = await self._request('GET', '/accounts')
             return result if isinstance(result, list) else []
         except Exception as e:
             logger.error(f"Failed to list accounts: {e}")
@@ -127,12 +227,27 @@ class TGMarketerAPIClient:
         }
 
         try:
-            result = self._request('POST', '/sessions', json=data)
+            result = await self._request('POST', '/sessions', json=data)
             return result is not None
         except Exception as e:
             logger.error(f"Failed to log session message: {e}")
             return False
 
+    async def log_sessions(self, entries: List[Dict[str, Any]]) -> bool:
+        """Ship a batch of session log entries in one request."""
+        data = {
+            'action': 'log-batch',
+            'logs': entries
+        }
+
+        try:
+            # The shipper keeps failed batches and retries on its own schedule
+            result = await self._request('POST', '/sessions', json=data, max_retries=1)
+            return result is not None
+        except Exception as e:
+            logger.error(f"Failed to ship {len(entries)} session log(s): {e}")
+            return False
+
     async def update_session_stats(self, session_id: str, messages_sent: int = 0,
                                    messages_failed: int = 0, groups_targeted: int = 0) -> bool:
         """Update session statistics."""
@@ -145,25 +260,25 @@ class TGMarketerAPIClient:
         }
 
         try:
-            result = self._request('POST', '/sessions', json=data)
+            result = await self._request('POST', '/sessions', json=data)
             return result is not None
         except Exception as e:
             logger.error(f"Failed to update session stats: {e}")
             return False
 
-    def get_sessions(self, user_id: str) -> List[Dict]:
+    async def get_sessions(self, user_id: str) -> List[Dict]:
         """Get all sessions for a user."""
         try:
-            result = self._request('GET', f'/sessions?action=list&user_id={user_id}')
+            result = await self._request('GET', '/sessions', params={'action': 'list', 'user_id': user_id})
             return result.get('sessions', []) if result else []
         except Exception as e:
             logger.error(f"Failed to get sessions: {e}")
             return []
 
-    def get_session(self, session_id: str, user_id: str) -> Optional[Dict]:
+    async def get_session(self, session_id: str, user_id: str) -> Optional[Dict]:
         """Get a specific session."""
         try:
-            result = self._request('GET', f'/sessions?action=get&id={session_id}&user_id={user_id}')
+            result = await self._request('GET', '/sessions', params={'action': 'get', 'id': session_id, 'user_id': user_id})
             return result.get('session') if result else None
         except Exception as e:
             logger.error(f"Failed to get session: {e}")
@@ -17,17 +17,47 @@ class WorkerConfig:
         self.api_url = self.config['server']['tg_marketer_api_url']
         self.jwt_token = os.getenv('TG_MARKETER_JWT') or self.config['server']['jwt_token']
         self.worker_id = self.config['server']['worker_id']
+        self.api_request_timeout_sec = self.config['server'].get('request_timeout_sec', 10)
+        self.api_connect_timeout_sec = self.config['server'].get('connect_timeout_sec', 5)
+        self.api_max_connections = self.config['server'].get('max_connections', 10)
 
         # Worker settings
         self.poll_interval_ms = self.config['worker']['poll_interval_ms']
+        self.max_poll_interval_ms = self.config['worker'].get('max_poll_interval_ms', 30000)
+        self.long_poll_ms = self.config['worker'].get('long_poll_ms', 20000)
         self.max_parallel_sessions = self.config['worker']['max_parallel_sessions']
         self.heartbeat_interval_sec = self.config['worker']['heartbeat_interval_sec']
+        self.heartbeat_full_every = self.config['worker'].get('heartbeat_full_every', 20)
+        self.heartbeat_max_skip_sec = self.config['worker'].get('heartbeat_max_skip_sec', self.heartbeat_interval_sec * 5)
         self.idle_timeout_sec = self.config['worker']['idle_timeout_sec']
+        # Never evict below the number of sessions that can be sending at once
+        self.max_clients = max(self.config['worker'].get('max_clients', 50), self.max_parallel_sessions)
+        self.result_batch_size = self.config['worker'].get('result_batch_size', 50)
+        self.result_flush_interval_ms = self.config['worker'].get('result_flush_interval_ms', 1000)
+        # Bounds what piles up while flushes keep failing; never below one batch
+        self.result_buffer_capacity = max(self.config['worker'].get('result_buffer_capacity', 5000),
+                                          self.result_batch_size)
+        self.job_lease_sec = self.config['worker'].get('job_lease_sec', 300)
+        self.lease_safety_sec = self.config['worker'].get('lease_safety_sec', 30)
+        self.prefetch_capacity = self.config['worker'].get('prefetch_capacity', self.max_parallel_sessions * 4)
+        self.prefetch_low_watermark = self.config['worker'].get('prefetch_low_watermark', self.max_parallel_sessions * 2)
+        self.prefetch_per_session = self.config['worker'].get('prefetch_per_session', 2)
+        self.lane_depth = self.config['worker'].get('lane_depth', 1)
+        self.session_shards = self.config['worker'].get('session_shards', 1)
+        self.warmup_sessions = self.config['worker'].get('warmup_sessions', False)
+        self.warmup_concurrency = self.config['worker'].get('warmup_concurrency', 10)
+        self.reconnect_base_delay_sec = self.config['worker'].get('reconnect_base_delay_sec', 1)
+        self.reconnect_max_delay_sec = self.config['worker'].get('reconnect_max_delay_sec', 60)
 
         # Session settings
         self.sessions_root_dir = Path(self.config['sessions']['root_dir'])
         self.auto_discover = self.config['sessions']['auto_discover']
         self.session_extension = self.config['sessions']['session_extension']
+        self.entity_cache_file = Path(self.config['sessions'].get('entity_cache_file', 'state/entity_cache.json'))
+        self.session_manifest_file = Path(self.config['sessions'].get('manifest_file', 'state/session_manifest.json'))
+        # 'auto' uses native file watching when watchdog is installed and polls otherwise
+        self.session_watch = self.config['sessions'].get('watch', 'auto')
+        self.session_watch_poll_sec = self.config['sessions'].get('watch_poll_sec', 5)
 
         # Sending settings
         self.default_delay_min_sec = self.config['sending']['default_delay_min_sec']
@@ -35,35 +65,33 @@ class WorkerConfig:
         self.group_delay_sec = self.config['sending']['group_delay_sec']
         self.flood_wait_multiplier = self.config['sending']['flood_wait_multiplier']
         self.max_retries = self.config['sending']['max_retries']
+        self.template_cache_size = self.config['sending'].get('template_cache_size', 256)
 
         # Limits
         self.global_hourly_limit = self.config['limits']['global_hourly_limit']
         self.global_daily_limit = self.config['limits']['global_daily_limit']
+        self.rate_limit_state_file = Path(self.config['limits'].get('state_file', 'state/rate_limits.json'))
+
+        # Metrics
+        metrics = self.config.get('metrics', {})
+        self.metrics_enabled = metrics.get('enabled', False)
+        self.metrics_host = metrics.get('host', '127.0.0.1')
+        self.metrics_port = metrics.get('port', 9108)
+        self.metrics_lag_interval_ms = metrics.get('lag_interval_ms', 500)
 
         # Logging
         self.log_level = self.config['logging']['level']
         self.log_file = Path(self.config['logging']['file'])
         self.log_max_size_mb = self.config['logging']['max_size_mb']
         self.log_backup_count = self.config['logging']['backup_count']
+        self.session_log_buffer_size = self.config['logging'].get('session_log_buffer_size', 1000)
+        self.session_log_batch_size = self.config['logging'].get('session_log_batch_size', 100)
+        self.session_log_flush_interval_ms = self.config['logging'].get('session_log_flush_interval_ms', 2000)
+        self.session_log_slow_flush_ms = self.config['logging'].get('session_log_slow_flush_ms', 2000)
+        self.session_log_max_message_len = self.config['logging'].get('session_log_max_message_len', 2000)
 
         # Ensure log directory exists
         self.log_file.parent.mkdir(parents=True, exist_ok=True)
 
     def get_session_path(self, session_key: str) -> Path:
         return self.sessions_root_dir / session_key / f"{session_key}{self.session_extension}"
-
-    def discover_sessions(self) -> list:
-        if not self.sessions_root_dir.exists():
-            return []
-
-        sessions = []
-        for folder in self.sessions_root_dir.iterdir():
-            if folder.is_dir():
-                session_file = folder / f"{folder.name}{self.session_extension}"
-                if session_file.exists():
-                    sessions.append({
-                        'session_key': folder.name,
-                        'path': session_file
-                    })
-
-        return sessions
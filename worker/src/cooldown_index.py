@@ -0,0 +1,43 @@
+import heapq
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+class CooldownIndex:
+    """Min-heap of cooldown expiries keyed by session, expired lazily from the top."""
+
+    def __init__(self):
+        self.heap: List[Tuple[float, str]] = []
+        self.expires_at: Dict[str, float] = {}
+
+    def __len__(self):
+        self._expire()
+        return len(self.expires_at)
+
+    def set(self, session_key: str, seconds: float):
+        expires_at = time.monotonic() + seconds
+        # Never shorten an existing cooldown
+        if expires_at <= self.expires_at.get(session_key, 0):
+            return
+        self.expires_at[session_key] = expires_at
+        heapq.heappush(self.heap, (expires_at, session_key))
+
+    def _expire(self):
+        now = time.monotonic()
+        while self.heap and self.heap[0][0] <= now:
+            expires_at, session_key = heapq.heappop(self.heap)
+            # Skip stale entries superseded by a later set()
+            if self.expires_at.get(session_key) == expires_at:
+                del self.expires_at[session_key]
+
+    def is_cooling(self, session_key: str) -> bool:
+        self._expire()
+        return session_key in self.expires_at
+
+    def eligible_at(self, session_key: str) -> Optional[float]:
+        """Monotonic time the session leaves cooldown, or None if it isn't cooling."""
+        self._expire()
+        return self.expires_at.get(session_key)
+
+    def cooling_sessions(self) -> Set[str]:
+        self._expire()
+        return set(self.expires_at)
@@ -0,0 +1,135 @@
+"""
+On-disk snapshot of a session's group/channel dialogs.
+
+Keeps only what SessionScript needs to target a dialog (marked id, access
+hash, title, writable flag) in slotted records, and refreshes incrementally:
+dialogs come newest-first, so a refresh stops at the first one that is not
+newer than the last sync.
+"""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, PeerChannel
+
+logger = logging.getLogger(__name__)
+
+
+class DialogRecord:
+    __slots__ = ('id', 'access_hash', 'title', 'writable')
+
+    def __init__(self, id: int, access_hash: int, title: str, writable: bool):
+        self.id = id
+        self.access_hash = access_hash
+        self.title = title
+        self.writable = writable
+
+    @classmethod
+    def from_dialog(cls, dialog) -> Optional['DialogRecord']:
+        if not (dialog.is_group or dialog.is_channel):
+            return None
+
+        entity = dialog.entity
+        # Broadcast channels only accept posts from their creator or admins
+        writable = not getattr(entity, 'broadcast', False) or bool(
+            getattr(entity, 'creator', False) or getattr(entity, 'admin_rights', None)
+        )
+        return cls(dialog.id, getattr(entity, 'access_hash', None) or 0, dialog.title or '', writable)
+
+    def input_peer(self):
+        peer_id, peer_type = utils.resolve_id(self.id)
+        if peer_type is PeerChannel:
+            return InputPeerChannel(peer_id, self.access_hash)
+        return InputPeerChat(peer_id)
+
+    def to_row(self) -> list:
+        return [self.id, self.access_hash, self.title, self.writable]
+
+
+class DialogSnapshot:
+    def __init__(self, path: Path, full_refresh_sec: float = 86400):
+        self.path = Path(path)
+        self.full_refresh_sec = full_refresh_sec
+        self.records: Dict[int, DialogRecord] = {}
+        # Unix time of the newest dialog seen, and of the last full walk
+        self.watermark = 0.0
+        self.full_synced_at = 0.0
+        self.dirty = False
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+            self.records = {row[0]: DialogRecord(*row) for row in data['dialogs']}
+            self.watermark = data.get('watermark', 0.0)
+            self.full_synced_at = data.get('full_synced_at', 0.0)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load dialog snapshot {self.path}: {e}")
+            self.records = {}
+            return False
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            tmp_path = self.path.with_suffix('.tmp')
+            tmp_path.write_text(json.dumps({
+                'watermark': self.watermark,
+                'full_synced_at': self.full_synced_at,
+                'dialogs': [record.to_row() for record in self.records.values()]
+            }, separators=(',', ':')), encoding='utf-8')
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save dialog snapshot {self.path}: {e}")
+
+    def needs_full_refresh(self) -> bool:
+        return not self.records or time.time() - self.full_synced_at >= self.full_refresh_sec
+
+    async def refresh(self, client) -> int:
+        """Walk dialogs newest-first; a full walk also forgets dialogs that are gone."""
+        full = self.needs_full_refresh()
+        seen = {}
+        newest = self.watermark
+
+        async for dialog in client.iter_dialogs():
+            date = dialog.date.timestamp() if dialog.date else 0.0
+            # Pinned dialogs are listed first regardless of date
+            if not full and not getattr(dialog, 'pinned', False) and date <= self.watermark:
+                break
+            newest = max(newest, date)
+
+            record = DialogRecord.from_dialog(dialog)
+            if record:
+                seen[record.id] = record
+
+        if full:
+            self.records = seen
+            self.full_synced_at = time.time()
+        else:
+            # Write failures stick until the next full walk re-checks them
+            for dialog_id, record in seen.items():
+                known = self.records.get(dialog_id)
+                if known and not known.writable:
+                    record.writable = False
+                self.records[dialog_id] = record
+
+        self.watermark = newest
+        self.dirty = True
+        self.save()
+        return len(seen)
+
+    def mark_unwritable(self, dialog_id: int):
+        record = self.records.get(dialog_id)
+        if record and record.writable:
+            record.writable = False
+            self.dirty = True
+
+    def writable(self) -> List[DialogRecord]:
+        return [record for record in self.records.values() if record.writable]
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from telethon import utils
+from telethon.tl.types import (
+    InputPeerChannel, InputPeerChat, InputPeerUser, TypeInputPeer
+)
+
+logger = logging.getLogger(__name__)
+
+class EntityCache:
+    """Persistent (session_key, chat_id) -> access hash map used to build InputPeers without resolving."""
+
+    def __init__(self, config):
+        self.cache_file = Path(config.entity_cache_file)
+        # session_key -> marked chat id -> (kind, peer id, access hash)
+        self.peers: Dict[str, Dict[str, Tuple[str, int, int]]] = {}
+        self.warmed = set()
+        self.dirty = False
+        self.stats = {'peer_hits': 0, 'peer_misses': 0}
+        self.load()
+
+    def get_input_peer(self, session_key: str, chat_id) -> Optional[TypeInputPeer]:
+        entry = self.peers.get(session_key, {}).get(str(int(chat_id)))
+        if not entry:
+            self.stats['peer_misses'] += 1
+            return None
+
+        self.stats['peer_hits'] += 1
+        kind, peer_id, access_hash = entry
+        if kind == 'channel':
+            return InputPeerChannel(peer_id, access_hash)
+        if kind == 'chat':
+            return InputPeerChat(peer_id)
+        return InputPeerUser(peer_id, access_hash)
+
+    def put_entity(self, session_key: str, entity):
+        try:
+            input_peer = utils.get_input_peer(entity, allow_self=False)
+        except TypeError:
+            return
+
+        if isinstance(input_peer, InputPeerChannel):
+            entry = ('channel', input_peer.channel_id, input_peer.access_hash)
+        elif isinstance(input_peer, InputPeerChat):
+            entry = ('chat', input_peer.chat_id, 0)
+        elif isinstance(input_peer, InputPeerUser):
+            entry = ('user', input_peer.user_id, input_peer.access_hash)
+        else:
+            return
+
+        self.peers.setdefault(session_key, {})[str(utils.get_peer_id(input_peer))] = entry
+        self.dirty = True
+
+    def invalidate(self, session_key: str, chat_id):
+        if self.peers.get(session_key, {}).pop(str(int(chat_id)), None):
+            self.dirty = True
+
+    def is_warm(self, session_key: str) -> bool:
+        return session_key in self.warmed or session_key in self.peers
+
+    async def warm(self, session_key: str, client) -> int:
+        """Fill the cache for a session in bulk from its dialog list."""
+        count = 0
+        try:
+            async for dialog in client.iter_dialogs():
+                self.put_entity(session_key, dialog.entity)
+                count += 1
+            logger.info(f"Cached {count} peer(s) for session {session_key}")
+        except Exception as e:
+            logger.error(f"Failed to warm entity cache for {session_key}: {e}")
+        finally:
+            self.warmed.add(session_key)
+
+        return count
+
+    async def warm_all(self, clients: Dict[str, object], concurrency: int) -> int:
+        """Warm every session not cached yet, a few at a time; returns peers cached."""
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+        async def warm(session_key: str, client) -> int:
+            async with semaphore:
+                return await self.warm(session_key, client)
+
+        counts = await asyncio.gather(*(warm(key, client) for key, client in clients.items()
+                                        if not self.is_warm(key)))
+        # One write for the whole warm-up; the file holds every session's peers
+        self.save()
+        return sum(counts)
+
+    def load(self):
+        if not self.cache_file.exists():
+            return
+        try:
+            data = json.loads(self.cache_file.read_text())
+            self.peers = {
+                session_key: {chat_id: tuple(entry) for chat_id, entry in peers.items()}
+                for session_key, peers in data.items()
+            }
+            logger.info(f"Loaded entity cache for {len(self.peers)} session(s)")
+        except Exception as e:
+            logger.error(f"Failed to load entity cache from {self.cache_file}: {e}")
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.cache_file.with_suffix('.tmp')
+            tmp_file.write_text(json.dumps(self.peers, separators=(',', ':')))
+            os.replace(tmp_file, self.cache_file)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save entity cache to {self.cache_file}: {e}")
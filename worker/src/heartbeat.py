@@ -1,15 +1,22 @@
 import logging
 import asyncio
 import socket
+import time
 from datetime import datetime
+from typing import Any, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
+# Monotonic stats sent as increments in delta heartbeats; everything else is sent when changed
+COUNTER_KEYS = ('messages_sent', 'messages_failed', 'pool_hits', 'pool_misses',
+                'pool_evictions', 'pool_idle_disconnects', 'pool_reconnects')
+
 class HeartbeatService:
-    def __init__(self, config, api_client, session_manager):
+    def __init__(self, config, api_client, session_manager, result_buffer=None):
         self.config = config
         self.api_client = api_client
         self.session_manager = session_manager
+        self.result_buffer = result_buffer
         self.hostname = socket.gethostname()
         self.version = "1.0.0"
         self.stats = {
@@ -21,6 +28,11 @@ class HeartbeatService:
         }
         self.running = False
         self.task = None
+        # What the server last acknowledged; None forces the next heartbeat to be full
+        self.sent_accounts: Optional[set] = None
+        self.sent_stats: Dict[str, Any] = {}
+        self.last_sent_at = 0.0
+        self.deltas_since_full = 0
 
     async def start(self):
         self.running = True
@@ -46,21 +58,18 @@ class HeartbeatService:
                 uptime = (datetime.now() - start_time).total_seconds()
                 self.stats['uptime_seconds'] = int(uptime)
 
-                # Get active sessions
+                # Get active sessions and client pool counters
                 active_accounts = self.session_manager.get_active_sessions()
+                self.stats.update(self.session_manager.get_pool_stats())
 
-                # Send heartbeat
-                success = self.api_client.send_heartbeat(
-                    hostname=self.hostname,
-                    version=self.version,
-                    active_accounts=active_accounts,
-                    stats=self.stats
-                )
-
-                if success:
-                    logger.debug(f"Heartbeat sent successfully. Active accounts: {len(active_accounts)}")
+                if self._liveness_proven():
+                    logger.debug("Skipping heartbeat, a recent result flush proved liveness")
                 else:
-                    logger.warning("Failed to send heartbeat")
+                    success = await self._send(active_accounts)
+                    if success:
+                        logger.debug(f"Heartbeat sent successfully. Active accounts: {len(active_accounts)}")
+                    else:
+                        logger.warning("Failed to send heartbeat")
 
             except Exception as e:
                 logger.error(f"Error in heartbeat loop: {e}")
@@ -69,6 +78,62 @@ class HeartbeatService:
             # Sleep for configured interval
             await asyncio.sleep(self.config.heartbeat_interval_sec)
 
+    def _liveness_proven(self) -> bool:
+        # The server refreshes last_heartbeat_at on every result flush, but stats
+        # and account changes still have to go out now and then
+        if not self.result_buffer or self.sent_accounts is None:
+            return False
+        now = time.monotonic()
+        last_flush_at = self.result_buffer.last_flush_at
+        return (last_flush_at is not None
+                and now - last_flush_at < self.config.heartbeat_interval_sec
+                and now - self.last_sent_at < self.config.heartbeat_max_skip_sec)
+
+    async def _send(self, active_accounts: list) -> bool:
+        accounts = set(active_accounts)
+        stats = dict(self.stats)
+
+        if self.sent_accounts is not None and self.deltas_since_full < self.config.heartbeat_full_every:
+            result = await self.api_client.send_heartbeat_delta(
+                accounts_added=sorted(accounts - self.sent_accounts),
+                accounts_removed=sorted(self.sent_accounts - accounts),
+                stats_delta={
+                    key: stats[key] - self.sent_stats.get(key, 0)
+                    for key in COUNTER_KEYS
+                    if key in stats and stats[key] != self.sent_stats.get(key, 0)
+                },
+                stats_set={
+                    key: value for key, value in stats.items()
+                    if key not in COUNTER_KEYS and self.sent_stats.get(key) != value
+                }
+            )
+            if result and not result.get('resync'):
+                self._acknowledge(accounts, stats)
+                self.deltas_since_full += 1
+                return True
+            if result is None:
+                # A timed-out delta may still have been applied; only a full heartbeat is safe now
+                self.sent_accounts = None
+                return False
+
+        success = await self.api_client.send_heartbeat(
+            hostname=self.hostname,
+            version=self.version,
+            active_accounts=sorted(accounts),
+            stats=stats
+        )
+        if success:
+            self._acknowledge(accounts, stats)
+            self.deltas_since_full = 0
+        else:
+            self.sent_accounts = None
+        return success
+
+    def _acknowledge(self, accounts: set, stats: Dict[str, Any]):
+        self.sent_accounts = accounts
+        self.sent_stats = stats
+        self.last_sent_at = time.monotonic()
+
     def increment_sent(self):
         self.stats['messages_sent'] += 1
 
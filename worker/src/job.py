@@ -0,0 +1,53 @@
+from typing import Any, Dict, List, Optional
+
+class Job:
+    """A claimed job: just the fields the worker reads, plus local lease bookkeeping."""
+
+    # Fields decoded from a pending-jobs response, in columnar column order
+    FIELDS = ('id', 'account_id', 'session_key', 'chat_id', 'template_id', 'template_version',
+              'hourly_sent', 'hourly_limit', 'daily_sent', 'daily_limit', 'template_text')
+
+    __slots__ = FIELDS + ('fetched_at', 'lease_deadline')
+
+    def __init__(self, id: str, account_id: Optional[str] = None, session_key: Optional[str] = None,
+                 chat_id=None, template_id: Optional[str] = None, template_version: Optional[int] = None,
+                 hourly_sent: Optional[int] = None, hourly_limit: Optional[int] = None,
+                 daily_sent: Optional[int] = None, daily_limit: Optional[int] = None,
+                 template_text: Optional[str] = None):
+        self.id = id
+        self.account_id = account_id
+        self.session_key = session_key
+        self.chat_id = chat_id
+        self.template_id = template_id
+        self.template_version = template_version
+        self.hourly_sent = hourly_sent
+        self.hourly_limit = hourly_limit
+        self.daily_sent = daily_sent
+        self.daily_limit = daily_limit
+        # Only set by an API that inlines template bodies
+        self.template_text = template_text
+        # Set when the job queue takes the batch in
+        self.fetched_at = 0.0
+        self.lease_deadline = 0.0
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'Job':
+        fields = {name: row.get(name) for name in cls.FIELDS}
+        # The row format joins tg_chats for the same id as chat_id_bigint
+        fields['chat_id'] = row.get('chat_id_bigint') or row.get('chat_id')
+        return cls(**fields)
+
+
+def decode_jobs(result: Optional[Dict[str, Any]]) -> List[Job]:
+    """Jobs from a pending-jobs response in either the row or the columnar format."""
+    if not result:
+        return []
+
+    if result.get('format') != 'columnar':
+        return [Job.from_row(row) for row in result.get('jobs', [])]
+
+    # Ignore columns this worker doesn't know, so the API can add some
+    known = [(name, values) for name, values in zip(result['columns'], result['data'])
+             if name in Job.FIELDS]
+    names = [name for name, _ in known]
+    return [Job(**dict(zip(names, row))) for row in zip(*(values for _, values in known))]
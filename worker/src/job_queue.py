@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter, deque
+from typing import Callable, Dict, List, Optional
+
+from job import Job
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """Bounded local job buffer, refilled in the background below a low watermark."""
+
+    def __init__(self, config, api_client, result_buffer, session_manager, rate_limiter, template_cache,
+                 in_flight: Optional[Callable[[], int]] = None):
+        self.config = config
+        self.api_client = api_client
+        self.result_buffer = result_buffer
+        self.session_manager = session_manager
+        self.rate_limiter = rate_limiter
+        self.template_cache = template_cache
+        # Jobs already handed to the sender's lanes and not finished yet
+        self.in_flight = in_flight or (lambda: 0)
+        self.capacity = config.prefetch_capacity
+        self.low_watermark = config.prefetch_low_watermark
+        self.jobs: deque = deque()
+        # Jobs held back while their account cools down: (eligible_at, seq, job)
+        self.parked: List[tuple] = []
+        self.park_seq = itertools.count()
+        self.not_empty = asyncio.Event()
+        self.below_watermark = asyncio.Event()
+        self.running = False
+        self.task = None
+        self.stats = {
+            'fetched': 0,
+            'expired': 0,
+            'parked': 0,
+            'released_cooldown': 0,
+            'limited': 0,
+            'fetches': 0,
+            'empty_fetches': 0,
+            'failed_fetches': 0
+        }
+
+    async def start(self):
+        self.running = True
+        self.below_watermark.set()
+        self.task = asyncio.create_task(self._refill_loop())
+        logger.info(f"Job queue started (capacity={self.capacity}, low_watermark={self.low_watermark})")
+
+    async def stop(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+        # Hand back prefetched and parked jobs that were never started
+        released = len(self.jobs) + len(self.parked)
+        for job in self.jobs:
+            self.result_buffer.add(job.id, 'released')
+        for _, _, job in self.parked:
+            self.result_buffer.add(job.id, 'released')
+        self.jobs.clear()
+        self.parked.clear()
+        self.not_empty.clear()
+        logger.info(f"Job queue stopped, released {released} unstarted job(s)")
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def _startable(self) -> int:
+        """Queued jobs whose session isn't reconnecting.
+
+        Jobs held for reconnecting sessions don't count towards the watermark or capacity,
+        or a few stuck sessions would stop claims for every healthy one until their leases
+        run out. Claims already exclude degraded sessions, so those jobs can't pile up.
+        """
+        degraded = self.session_manager.get_degraded_sessions()
+        if not degraded:
+            return len(self.jobs)
+        return sum(1 for job in self.jobs if job.session_key not in degraded)
+
+    def park(self, jobs: List[Job]):
+        """Hold jobs for cooling accounts locally, or release them if the lease runs out first.
+
+        Jobs for accounts that aren't cooling go back to the front of the queue. Once the
+        queue is stopped (lanes still finishing during shutdown) they are released instead.
+        """
+        if not self.running:
+            for job in jobs:
+                self.result_buffer.add(job.id, 'released')
+            return
+
+        for job in jobs:
+            eligible_at = self.session_manager.cooldowns.eligible_at(job.session_key)
+            if eligible_at is None:
+                self.jobs.appendleft(job)
+                self.not_empty.set()
+            elif eligible_at < job.lease_deadline:
+                heapq.heappush(self.parked, (eligible_at, next(self.park_seq), job))
+                self.stats['parked'] += 1
+            else:
+                self.result_buffer.add(job.id, 'released')
+                self.stats['released_cooldown'] += 1
+
+    def _unpark(self):
+        now = time.monotonic()
+        while self.parked and self.parked[0][0] <= now:
+            _, _, job = heapq.heappop(self.parked)
+            self.jobs.appendleft(job)
+        if self.jobs:
+            self.not_empty.set()
+
+    async def take(self, max_jobs: int, timeout: float, lane_load: Optional[Dict[str, int]] = None,
+                   lane_depth: int = 1) -> List[Job]:
+        """Wait up to timeout for work, then pop up to max_jobs with live leases.
+
+        Jobs for sessions that are reconnecting stay queued. With lane_load, jobs for
+        sessions that already have lane_depth jobs waiting to be sent stay queued in
+        order for a later take.
+        """
+        self._unpark()
+        try:
+            await asyncio.wait_for(self.not_empty.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return []
+
+        now = time.monotonic()
+        batch = []
+        cooling = []
+        kept = deque()
+        load = dict(lane_load or {})
+        while self.jobs and len(batch) < max_jobs:
+            job = self.jobs.popleft()
+            if job.lease_deadline <= now:
+                # Too close to lease expiry to start safely; let another worker have it
+                self.result_buffer.add(job.id, 'released')
+                self.stats['expired'] += 1
+                continue
+            if self.session_manager.is_in_cooldown(job.session_key):
+                cooling.append(job)
+                continue
+            session_key = job.session_key
+            if not self.session_manager.is_ready(session_key):
+                # Reconnecting in the background; keep it queued until the session is ready
+                kept.append(job)
+                continue
+            if lane_load is not None and load.get(session_key, 0) >= lane_depth:
+                kept.append(job)
+                continue
+            load[session_key] = load.get(session_key, 0) + 1
+            batch.append(job)
+        kept.extend(self.jobs)
+        self.jobs = kept
+        self.park(cooling)
+
+        if not self.jobs:
+            self.not_empty.clear()
+        if self._startable() <= self.low_watermark:
+            self.below_watermark.set()
+
+        return batch
+
+    def _enqueue(self, jobs: List[Job], fetched_at: float):
+        deadline = fetched_at + self.config.job_lease_sec - self.config.lease_safety_sec
+        for job in jobs:
+            job.fetched_at = fetched_at
+            job.lease_deadline = deadline
+            self.jobs.append(job)
+        self.stats['fetched'] += len(jobs)
+        if self.jobs:
+            self.not_empty.set()
+
+    async def _refill_loop(self):
+        poll_delay_ms = self.config.poll_interval_ms
+
+        while self.running:
+            try:
+                startable = self._startable()
+                if startable > self.low_watermark:
+                    self.below_watermark.clear()
+                    await self.below_watermark.wait()
+                    continue
+
+                # Parked jobs still hold claims, so they count against capacity
+                room = self.capacity - startable - len(self.parked)
+                if room <= 0:
+                    await asyncio.sleep(1)
+                    continue
+
+                # Only claim what the global hourly/daily limits still allow us to send. A job
+                # mid-send also holds a reservation, which only errs towards claiming less
+                allowed = (self.rate_limiter.remaining() - len(self.jobs) - len(self.parked)
+                           - self.in_flight())
+                if allowed <= 0:
+                    wait_sec = max(self.rate_limiter.seconds_until_available(), 1)
+                    self.stats['limited'] += 1
+                    logger.info(f"Global send limit reached, pausing claims for {wait_sec:.0f}s")
+                    await asyncio.sleep(min(wait_sec, 60))
+                    continue
+                room = min(room, allowed)
+
+                # Don't claim more for sessions that already have enough jobs waiting locally
+                queued = Counter(job.session_key for job in self.jobs)
+                full_sessions = {key for key, count in queued.items() if count >= self.config.prefetch_per_session}
+
+                # Fetch pending jobs, letting the server hold the request when long-polling
+                fetch_started = time.monotonic()
+                jobs = await self.api_client.get_pending_jobs(
+                    limit=room,
+                    lease_sec=self.config.job_lease_sec,
+                    wait_ms=self.config.long_poll_ms,
+                    exclude_sessions=(self.session_manager.get_cooling_sessions()
+                                      | self.session_manager.get_unauthorized_sessions()
+                                      | self.session_manager.get_degraded_sessions()
+                                      | full_sessions),
+                    per_session_limit=self.config.prefetch_per_session
+                )
+                fetch_ms = (time.monotonic() - fetch_started) * 1000
+                self.stats['fetches'] += 1
+
+                if jobs:
+                    poll_delay_ms = self.config.poll_interval_ms
+                    # One request for every template this batch needs that isn't cached
+                    await self.template_cache.prefetch(jobs)
+                    self._enqueue(jobs, fetch_started)
+                    logger.debug(f"Prefetched {len(jobs)} job(s), queue depth {len(self.jobs)}")
+                    continue
+
+                if jobs is None:
+                    # A slow failure looks like a held long-poll; it must still back off
+                    self.stats['failed_fetches'] += 1
+                else:
+                    self.stats['empty_fetches'] += 1
+
+                    # The server already waited for us, so poll again right away
+                    if self.config.long_poll_ms and fetch_ms >= self.config.long_poll_ms / 2:
+                        continue
+
+                # Plain polling, long-poll unsupported or the API failing: back off adaptively
+                await asyncio.sleep(poll_delay_ms / 1000)
+                poll_delay_ms = min(poll_delay_ms * 2, self.config.max_poll_interval_ms)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in job queue refill loop: {e}", exc_info=True)
+                await asyncio.sleep(5)
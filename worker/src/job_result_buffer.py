@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lowest priority first: dropped first when failing flushes fill the buffer. A lost
+# terminal status leaves the job claimed until its lease lapses, a lost 'running' doesn't
+STATUS_PRIORITY = {'running': 0, 'released': 1, 'failed': 2, 'done': 3}
+# Longest wait between flush attempts while the API keeps failing
+MAX_FLUSH_BACKOFF_SEC = 60
+
+class JobResultBuffer:
+    """Coalesces job status transitions and flushes them via the bulk update-jobs action."""
+
+    def __init__(self, config, api_client):
+        self.config = config
+        self.api_client = api_client
+        self.batch_size = config.result_batch_size
+        self.capacity = config.result_buffer_capacity
+        self.flush_interval_sec = config.result_flush_interval_ms / 1000
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.flush_event = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.running = False
+        self.task = None
+        # Monotonic time of the last successful flush; the server treats it as liveness
+        self.last_flush_at: Optional[float] = None
+        self.failed_flushes = 0
+        self.stats = {
+            'transitions': 0,
+            'flushes': 0,
+            'jobs_flushed': 0,
+            'dropped': 0
+        }
+
+    async def start(self):
+        self.running = True
+        self.task = asyncio.create_task(self._flush_loop())
+        logger.info("Job result buffer started")
+
+    async def stop(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+        # Final flush so no results are lost on shutdown
+        await self.flush()
+        logger.info("Job result buffer stopped")
+
+    def add(self, job_id: str, status: str, error_message: Optional[str] = None,
+            sent_at: Optional[str] = None):
+        update = {'job_id': job_id, 'status': status, 'attempted': status == 'running'}
+        if error_message:
+            update['error_message'] = error_message
+        if sent_at:
+            update['sent_at'] = sent_at
+
+        previous = self.pending.get(job_id)
+        self.pending[job_id] = self._merge(previous, update) if previous else update
+        self.stats['transitions'] += 1
+        if not previous and len(self.pending) > self.capacity:
+            self._trim()
+
+        if len(self.pending) >= self.batch_size:
+            self.flush_event.set()
+
+    def _trim(self):
+        # Evict the oldest updates of the lowest status until the buffer fits again
+        ranked = sorted(enumerate(self.pending.items()),
+                        key=lambda item: (STATUS_PRIORITY.get(item[1][1]['status'], 0), item[0]))
+        dropped = Counter()
+        for _, (job_id, update) in ranked[:len(self.pending) - self.capacity]:
+            del self.pending[job_id]
+            dropped[update['status']] += 1
+        self.stats['dropped'] += sum(dropped.values())
+        logger.warning(f"Job result buffer full ({self.capacity}), dropped "
+                       f"{sum(dropped.values())} unsent update(s): {dict(dropped)}")
+
+    @staticmethod
+    def _merge(older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+        # The newest status wins, but a coalesced 'running' must still count as an attempt
+        merged = {**older, **newer}
+        merged['attempted'] = older.get('attempted', False) or newer.get('attempted', False)
+        return merged
+
+    async def flush(self) -> bool:
+        async with self.flush_lock:
+            if not self.pending:
+                return True
+
+            batch = self.pending
+            self.pending = {}
+            self.flush_event.clear()
+
+            success = await self.api_client.update_jobs(list(batch.values()))
+
+            if success:
+                self.failed_flushes = 0
+                self.last_flush_at = time.monotonic()
+                self.stats['flushes'] += 1
+                self.stats['jobs_flushed'] += len(batch)
+                logger.debug(f"Flushed {len(batch)} job result(s)")
+            else:
+                # Put the batch back underneath anything that arrived meanwhile, keeping
+                # it ahead so the oldest results are still the first ones _trim drops
+                pending = dict(batch)
+                for job_id, newer in self.pending.items():
+                    older = pending.get(job_id)
+                    pending[job_id] = self._merge(older, newer) if older else newer
+                self.pending = pending
+                self.failed_flushes += 1
+                logger.warning(f"Failed to flush {len(batch)} job result(s), will retry")
+                if len(self.pending) > self.capacity:
+                    self._trim()
+
+            return success
+
+    async def _flush_loop(self):
+        while self.running:
+            if self.failed_flushes:
+                # Back off while the API is down; a full batch doesn't cut the wait short
+                await asyncio.sleep(min(self.flush_interval_sec * 2 ** self.failed_flushes,
+                                        MAX_FLUSH_BACKOFF_SEC))
+            else:
+                try:
+                    await asyncio.wait_for(self.flush_event.wait(), timeout=self.flush_interval_sec)
+                except asyncio.TimeoutError:
+                    pass
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error in job result flush loop: {e}")
@@ -2,13 +2,20 @@ import asyncio
 import logging
 import signal
 import sys
+import time
 from pathlib import Path
 
 from config import WorkerConfig
 from api_client import TGMarketerAPIClient
 from session_manager import SessionManager
 from message_sender import MessageSender
+from job_result_buffer import JobResultBuffer
+from job_queue import JobQueue
+from rate_limiter import GlobalRateLimiter
+from entity_cache import EntityCache
+from template_cache import TemplateCache
 from heartbeat import HeartbeatService
+from metrics import MetricsServer
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +27,31 @@ class TGWorker:
         self.api_client = TGMarketerAPIClient(
             self.config.api_url,
             self.config.jwt_token,
-            self.config.worker_id
+            self.config.worker_id,
+            request_timeout_sec=self.config.api_request_timeout_sec,
+            connect_timeout_sec=self.config.api_connect_timeout_sec,
+            max_connections=self.config.api_max_connections
         )
 
         self.session_manager = SessionManager(self.config)
-        self.message_sender = MessageSender(self.config, self.session_manager, self.api_client)
-        self.heartbeat_service = HeartbeatService(self.config, self.api_client, self.session_manager)
+        self.result_buffer = JobResultBuffer(self.config, self.api_client)
+        self.rate_limiter = GlobalRateLimiter(self.config)
+        self.template_cache = TemplateCache(self.config, self.api_client)
+        self.job_queue = JobQueue(
+            self.config, self.api_client, self.result_buffer, self.session_manager, self.rate_limiter,
+            self.template_cache, in_flight=lambda: self.message_sender.in_flight
+        )
+        self.entity_cache = EntityCache(self.config)
+        self.message_sender = MessageSender(
+            self.config, self.session_manager, self.api_client, self.result_buffer,
+            self.job_queue, self.rate_limiter, self.entity_cache, self.template_cache
+        )
+        self.heartbeat_service = HeartbeatService(
+            self.config, self.api_client, self.session_manager, self.result_buffer
+        )
+        self.metrics_server = MetricsServer(
+            self.config, self.job_queue, self.session_manager, self.message_sender
+        )
 
         self.running = False
         self.setup_signal_handlers()
@@ -64,47 +90,70 @@ class TGWorker:
         logger.info(f"API URL: {self.config.api_url}")
         logger.info(f"Sessions root: {self.config.sessions_root_dir}")
 
+        # Start the local metrics endpoint
+        await self.metrics_server.start()
+
+        # Load the session index and start the pool maintenance
+        await self.session_manager.start()
+
         # Discover sessions
         if self.config.auto_discover:
             sessions = self.session_manager.discover_sessions()
             logger.info(f"Discovered {len(sessions)} session(s)")
             for session in sessions:
-                logger.info(f"  - {session['session_key']}: {session['path']}")
+                logger.debug(f"  - {session['session_key']}: {session['path']}")
+
+            # Connect sessions up front so first sends don't pay for it
+            if self.config.warmup_sessions:
+                await self.warm_up_sessions(sessions)
 
         # Start heartbeat service
         await self.heartbeat_service.start()
 
+        # Start job result flushing
+        await self.result_buffer.start()
+
+        # Start background prefetching
+        await self.job_queue.start()
+
         # Main loop
         self.running = True
         idle_count = 0
-        max_idle = self.config.idle_timeout_sec / (self.config.poll_interval_ms / 1000)
 
-        logger.info("Entering main polling loop...")
+        logger.info("Entering main processing loop...")
 
         while self.running:
             try:
-                # Fetch pending jobs
-                jobs = self.api_client.get_pending_jobs(limit=self.config.max_parallel_sessions * 2)
+                # Fold finished lane work into the heartbeat counters
+                stats = self.message_sender.take_stats()
+                self.heartbeat_service.stats['messages_sent'] += stats['success']
+                self.heartbeat_service.stats['messages_failed'] += stats['failed']
+
+                # Keep every lane fed without waiting for the slowest session
+                room = (self.config.max_parallel_sessions * (self.config.lane_depth + 1)
+                        - self.message_sender.in_flight)
+                if room <= 0:
+                    await self.message_sender.wait_for_progress(timeout=1.0)
+                    continue
+
+                # Take prefetched jobs; the queue refills itself in the background
+                jobs = await self.job_queue.take(
+                    room, timeout=1.0,
+                    lane_load=self.message_sender.lane_load(),
+                    lane_depth=self.config.lane_depth
+                )
 
                 if jobs:
                     idle_count = 0
-                    logger.info(f"Fetched {len(jobs)} job(s) for processing")
-
-                    # Process jobs
-                    stats = await self.message_sender.process_jobs(jobs)
-
-                    logger.info(f"Batch complete: {stats}")
-
-                    # Update heartbeat stats
-                    self.heartbeat_service.stats['messages_sent'] += stats['success']
-                    self.heartbeat_service.stats['messages_failed'] += stats['failed']
+                    logger.debug(f"Dispatching {len(jobs)} job(s) ({len(self.job_queue)} prefetched)")
+                    self.message_sender.dispatch(jobs)
+                elif len(self.job_queue):
+                    # Everything prefetched is for sessions whose lanes are already full
+                    await self.message_sender.wait_for_progress(timeout=1.0)
                 else:
                     idle_count += 1
                     if idle_count % 10 == 0:
-                        logger.debug(f"No jobs available ({idle_count} idle polls)")
-
-                # Sleep for poll interval
-                await asyncio.sleep(self.config.poll_interval_ms / 1000)
+                        logger.debug(f"No jobs available ({idle_count}s idle)")
 
             except KeyboardInterrupt:
                 logger.info("Keyboard interrupt received")
@@ -117,15 +166,64 @@ class TGWorker:
         # Graceful shutdown
         await self.shutdown()
 
+    async def warm_up_sessions(self, sessions: list):
+        # Warming more than the pool holds would only evict the first ones again
+        session_keys = [session['session_key'] for session in sessions][:self.config.max_clients]
+        logger.info(f"Warming up {len(session_keys)} session(s), {self.config.warmup_concurrency} at a time")
+
+        started = time.monotonic()
+        report = await self.session_manager.warm_up(session_keys, self.config.warmup_concurrency)
+        connect_times = sorted(elapsed for elapsed in report.values() if elapsed is not None)
+
+        unauthorized = self.session_manager.get_unauthorized_sessions()
+        for session_key in unauthorized & report.keys():
+            await self.api_client.update_account(
+                None, status='error', error_message='Session not authorized', session_key=session_key
+            )
+
+        summary = f"{len(connect_times)}/{len(report)} session(s) ready in {time.monotonic() - started:.1f}s"
+        if connect_times:
+            summary += (f", connect p50 {connect_times[len(connect_times) // 2] * 1000:.0f} ms"
+                        f", max {connect_times[-1] * 1000:.0f} ms")
+        if unauthorized:
+            summary += f", {len(unauthorized)} unauthorized"
+
+        # Fill the peer caches now, before any lane is sending
+        clients = {session_key: self.session_manager.clients[session_key]
+                   for session_key in report.keys() - unauthorized
+                   if session_key in self.session_manager.clients}
+        peers = await self.entity_cache.warm_all(clients, self.config.warmup_concurrency)
+        summary += f", {peers} peer(s) cached"
+        logger.info(f"Warm-up done: {summary}")
+
     async def shutdown(self):
         logger.info("Shutting down worker...")
 
         # Stop heartbeat
         await self.heartbeat_service.stop()
 
+        # Stop prefetching and hand back unstarted jobs
+        await self.job_queue.stop()
+
+        # Let in-progress sends finish and release dispatched jobs
+        await self.message_sender.stop()
+
+        # Flush buffered job results
+        await self.result_buffer.stop()
+
+        # Persist global rate limit windows and resolved peers
+        self.rate_limiter.save()
+        self.entity_cache.save()
+
         # Close all sessions
         await self.session_manager.close_all()
 
+        # Release pooled API connections
+        await self.api_client.close()
+
+        # Stop serving metrics last so shutdown stays observable
+        await self.metrics_server.stop()
+
         logger.info("Worker shutdown complete")
 
 def main():
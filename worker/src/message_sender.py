@@ -1,28 +1,54 @@
 import logging
 import random
 import asyncio
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict
 from telethon import TelegramClient
 from telethon.errors import (
     FloodWaitError, ChatWriteForbiddenError, UserBannedInChannelError,
-    ChannelPrivateError, ChatAdminRequiredError, RPCError
+    ChannelPrivateError, ChatAdminRequiredError, RPCError,
+    PeerIdInvalidError, ChannelInvalidError
 )
 
+from job import Job
+from metrics import SEND_LATENCY, CLAIM_TO_SEND
+
 logger = logging.getLogger(__name__)
 
+# Errors that leave a job untouched for later rather than failing it
+SKIP_ERRORS = ("Account in cooldown", "Session reconnecting", "Account limit reached",
+               "Global limit reached", "Lease expired", "Template unavailable", "Session unavailable")
+# Errors that hand the rest of a session's lane back to the queue; only ever
+# returned before 'running' is reported for the job
+REQUEUE_ERRORS = ("Account in cooldown", "Session reconnecting")
+
 class MessageSender:
-    def __init__(self, config, session_manager, api_client):
+    def __init__(self, config, session_manager, api_client, result_buffer, job_queue, rate_limiter,
+                 entity_cache, template_cache):
         self.config = config
         self.session_manager = session_manager
         self.api_client = api_client
+        self.result_buffer = result_buffer
+        self.job_queue = job_queue
+        self.rate_limiter = rate_limiter
+        self.entity_cache = entity_cache
+        self.template_cache = template_cache
+        self.lane_slots = asyncio.Semaphore(config.max_parallel_sessions)
+        self.send_log: Dict[str, deque] = {}
+        # session_key -> jobs dispatched but not yet started, drained by one task per session
+        self.lanes: Dict[str, deque] = {}
+        self.lane_tasks: Dict[str, asyncio.Task] = {}
+        self.in_flight = 0
+        self.progress = asyncio.Event()
+        self.stats = {'success': 0, 'failed': 0, 'skipped': 0}
 
-    async def send_message(self, job: Dict[str, Any]) -> tuple[bool, Optional[str]]:
-        job_id = job['id']
-        session_key = job.get('session_key')
-        chat_id = job.get('chat_id_bigint') or job.get('chat_id')
-        template_text = job.get('template_text', '')
-        account_id = job.get('account_id')
+    async def send_message(self, job: Job) -> tuple[bool, Optional[str]]:
+        job_id = job.id
+        session_key = job.session_key
+        chat_id = job.chat_id
+        account_id = job.account_id
 
         if not session_key or not chat_id:
             error = "Missing session_key or chat_id"
@@ -31,37 +57,98 @@ class MessageSender:
 
         # Check cooldown
         if self.session_manager.is_in_cooldown(session_key):
-            logger.info(f"Session {session_key} is in cooldown, skipping job {job_id}")
+            logger.info(f"Session {session_key} is in cooldown, deferring job {job_id}")
             return False, "Account in cooldown"
 
+        # Never wait on a reconnect here; the session's supervisor handles it
+        if not self.session_manager.is_ready(session_key):
+            logger.info(f"Session {session_key} is reconnecting, deferring job {job_id}")
+            return False, "Session reconnecting"
+
+        # Check the worker-wide hourly/daily limits
+        if not self.rate_limiter.allow():
+            logger.info(f"Global send limit reached, releasing job {job_id}")
+            self.result_buffer.add(job_id, 'released')
+            return False, "Global limit reached"
+
+        # Check the account's hourly/daily limits
+        if not self._within_account_limits(job):
+            logger.info(f"Session {session_key} reached its send limit, releasing job {job_id}")
+            self.result_buffer.add(job_id, 'released')
+            return False, "Account limit reached"
+
         # Get Telethon client
         client = await self.session_manager.get_client(session_key)
         if not client:
-            error = f"Failed to load session {session_key}"
-            logger.error(f"Job {job_id}: {error}")
-            return False, error
+            logger.error(f"Job {job_id}: failed to load session {session_key}")
+            # Nothing was attempted; hand the claim back rather than let it lapse
+            self.result_buffer.add(job_id, 'released')
+            return False, "Session unavailable"
+
+        # Resolve the peer from the entity cache so the send is a single RPC; the
+        # cache is filled at warm-up, never with a dialog walk on the send path
+        peer = self.entity_cache.get_input_peer(session_key, chat_id)
+
+        # Don't start a job whose claim may already have lapsed server-side
+        if job.lease_deadline and time.monotonic() >= job.lease_deadline:
+            logger.info(f"Lease expired before start, releasing job {job_id}")
+            self.result_buffer.add(job_id, 'released')
+            return False, "Lease expired"
+
+        # Jobs reference their template; the body comes from the shared cache
+        template_text = await self.template_cache.get_text(job)
+        if template_text is None:
+            logger.warning(f"Template {job.template_id} unavailable, releasing job {job_id}")
+            self.result_buffer.add(job_id, 'released')
+            return False, "Template unavailable"
+
+        # Other lanes may have used up the global limit since the check above
+        if not self.rate_limiter.reserve():
+            logger.info(f"Global send limit reached, releasing job {job_id}")
+            self.result_buffer.add(job_id, 'released')
+            return False, "Global limit reached"
 
         try:
             # Update job status to running
-            await self.api_client.update_job(job_id, 'running')
+            self.result_buffer.add(job_id, 'running')
 
             # Add random delay before sending
             delay = random.uniform(
                 self.config.default_delay_min_sec,
                 self.config.default_delay_max_sec
             )
-            await asyncio.sleep(delay)
 
-            # Send the message
-            await client.send_message(
-                int(chat_id),
-                template_text
-            )
+            try:
+                await asyncio.sleep(delay)
+
+                # Send the message
+                send_started = time.monotonic()
+                try:
+                    message = await client.send_message(
+                        peer or int(chat_id),
+                        template_text
+                    )
+                finally:
+                    SEND_LATENCY.observe(time.monotonic() - send_started)
+            except BaseException:
+                # Nothing was sent; hand the slot back before handling the error
+                self.rate_limiter.release()
+                raise
+
+            # Count the send in the window and free its slot before the pacing sleep
+            self.rate_limiter.record()
+            self.rate_limiter.release()
+            if peer is None and getattr(message, 'input_chat', None):
+                # Keep the peer Telethon resolved so the next send to this chat is a hit
+                self.entity_cache.put_entity(session_key, message.input_chat)
+            if job.fetched_at:
+                CLAIM_TO_SEND.observe(time.monotonic() - job.fetched_at)
 
             logger.info(f"Successfully sent message for job {job_id} to chat {chat_id}")
+            self._record_send(session_key)
 
             # Update job as done
-            await self.api_client.update_job(job_id, 'done', sent_at=datetime.now().isoformat())
+            self.result_buffer.add(job_id, 'done', sent_at=datetime.now().isoformat())
 
             # Add delay after sending
             await asyncio.sleep(self.config.group_delay_sec)
@@ -84,7 +171,7 @@ class MessageSender:
             )
 
             # Mark job for retry
-            await self.api_client.update_job(
+            self.result_buffer.add(
                 job_id,
                 'failed',
                 error_message=f"FloodWait: {e.seconds}s"
@@ -95,38 +182,137 @@ class MessageSender:
         except ChatWriteForbiddenError as e:
             error = f"Cannot send to chat {chat_id}: Write forbidden"
             logger.error(f"Job {job_id}: {error}")
-            await self.api_client.update_job(job_id, 'failed', error_message=error)
+            self.result_buffer.add(job_id, 'failed', error_message=error)
             return False, error
 
         except (UserBannedInChannelError, ChannelPrivateError, ChatAdminRequiredError) as e:
             error = f"Access denied to chat {chat_id}: {str(e)}"
             logger.error(f"Job {job_id}: {error}")
-            await self.api_client.update_job(job_id, 'failed', error_message=error)
+            self.result_buffer.add(job_id, 'failed', error_message=error)
             return False, error
 
         except RPCError as e:
             error = f"Telegram RPC error: {str(e)}"
             logger.error(f"Job {job_id}: {error}")
-            await self.api_client.update_job(job_id, 'failed', error_message=error)
+            if peer and isinstance(e, (PeerIdInvalidError, ChannelInvalidError)):
+                # Stale access hash; resolve afresh next time
+                self.entity_cache.invalidate(session_key, chat_id)
+            self.result_buffer.add(job_id, 'failed', error_message=error)
+            return False, error
+
+        except ConnectionError as e:
+            # Dropped mid-send. 'running' is already reported and the server only
+            # releases assigned jobs, so retry it through the failed path; the
+            # supervisor reconnects the session meanwhile
+            error = f"Connection lost: {e}"
+            logger.warning(f"Job {job_id}: connection lost for session {session_key}: {e}")
+            self.result_buffer.add(job_id, 'failed', error_message=error)
             return False, error
 
         except Exception as e:
             error = f"Unexpected error: {str(e)}"
             logger.error(f"Job {job_id}: {error}", exc_info=True)
-            await self.api_client.update_job(job_id, 'failed', error_message=error)
+            self.result_buffer.add(job_id, 'failed', error_message=error)
             return False, error
 
-    async def process_jobs(self, jobs: list) -> Dict[str, int]:
-        stats = {'success': 0, 'failed': 0, 'skipped': 0}
+    def _record_send(self, session_key: str):
+        sends = self.send_log.setdefault(session_key, deque())
+        now = time.monotonic()
+        sends.append(now)
+        while sends and sends[0] < now - 86400:
+            sends.popleft()
+
+    def _within_account_limits(self, job: Job) -> bool:
+        # The claim snapshot of hourly/daily counters doesn't include what this
+        # worker has sent for the account since the job was fetched
+        sends = self.send_log.get(job.session_key, ())
+        now = time.monotonic()
 
+        for sent, limit, window in ((job.hourly_sent, job.hourly_limit, 3600),
+                                    (job.daily_sent, job.daily_limit, 86400)):
+            if limit is None:
+                continue
+            since = max(job.fetched_at, now - window)
+            local_sent = sum(1 for t in sends if t >= since)
+            if (sent or 0) + local_sent >= limit:
+                return False
+
+        return True
+
+    def dispatch(self, jobs: list):
+        """Queue jobs onto their session's lane, starting a lane task if none is running."""
         for job in jobs:
-            success, error = await self.send_message(job)
+            session_key = job.session_key
+            self.lanes.setdefault(session_key, deque()).append(job)
+            self.in_flight += 1
+            if session_key not in self.lane_tasks:
+                self.lane_tasks[session_key] = asyncio.create_task(self._run_lane(session_key))
 
-            if success:
-                stats['success'] += 1
-            elif error and 'cooldown' in error.lower():
-                stats['skipped'] += 1
-            else:
-                stats['failed'] += 1
+    def lane_load(self) -> Dict[str, int]:
+        """Jobs waiting (not yet being sent) per session."""
+        return {session_key: len(lane) for session_key, lane in self.lanes.items()}
 
+    def take_stats(self) -> Dict[str, int]:
+        stats = self.stats
+        self.stats = {'success': 0, 'failed': 0, 'skipped': 0}
         return stats
+
+    async def wait_for_progress(self, timeout: float):
+        """Wait until some lane finishes a job, or timeout."""
+        self.progress.clear()
+        try:
+            await asyncio.wait_for(self.progress.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run_lane(self, session_key: str):
+        # One lane per session: its pacing sleeps only ever block this account,
+        # and it keeps draining whatever is dispatched to it while it runs
+        lane = self.lanes[session_key]
+        try:
+            async with self.lane_slots:
+                # The pool must not disconnect the client while this lane sends on it
+                self.session_manager.pin(session_key)
+                try:
+                    while lane:
+                        job = lane.popleft()
+                        try:
+                            success, error = await self.send_message(job)
+                        finally:
+                            self.in_flight -= 1
+                            self.progress.set()
+
+                        if success:
+                            self.stats['success'] += 1
+                        elif error in REQUEUE_ERRORS:
+                            # Park this and the rest of the lane until the account is eligible
+                            # again, or put it back in the queue until the session reconnects
+                            parked = [job, *lane]
+                            lane.clear()
+                            self.in_flight -= len(parked) - 1
+                            self.job_queue.park(parked)
+                            self.stats['skipped'] += len(parked)
+                        elif error in SKIP_ERRORS:
+                            self.stats['skipped'] += 1
+                        else:
+                            self.stats['failed'] += 1
+                finally:
+                    self.session_manager.unpin(session_key)
+        finally:
+            del self.lane_tasks[session_key]
+            if not lane:
+                del self.lanes[session_key]
+
+    async def stop(self):
+        """Hand back jobs that were dispatched but not started, then let running sends finish."""
+        released = 0
+        for lane in self.lanes.values():
+            for job in lane:
+                self.result_buffer.add(job.id, 'released')
+                released += 1
+            self.in_flight -= len(lane)
+            lane.clear()
+        if released:
+            logger.info(f"Released {released} dispatched job(s) that were not started")
+
+        await asyncio.gather(*self.lane_tasks.values(), return_exceptions=True)
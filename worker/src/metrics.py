@@ -0,0 +1,190 @@
+import asyncio
+import bisect
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Seconds; wide enough for both millisecond API calls and multi-second sends
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CLAIM_TO_SEND_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by label values."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self.series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total) in sorted(self.series.items()):
+            labels = tuple(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total[0]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from the owning component at scrape time."""
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self) -> List[str]:
+        try:
+            value = float(self.read())
+        except Exception as e:
+            logger.debug(f"Failed to read gauge {self.name}: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value:g}"]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        if name not in self.metrics:
+            self.metrics[name] = Histogram(name, help_text, label_names, buckets)
+        return self.metrics[name]
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> Gauge:
+        # Re-registering replaces the reader, so a restarted worker reports its own state
+        self.metrics[name] = Gauge(name, help_text, read)
+        return self.metrics[name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+API_LATENCY = REGISTRY.histogram(
+    'tg_worker_api_request_seconds', 'TG Marketer API request latency by action', ('action',)
+)
+SEND_LATENCY = REGISTRY.histogram(
+    'tg_worker_send_seconds', 'Telethon send_message latency'
+)
+SESSION_CONNECT = REGISTRY.histogram(
+    'tg_worker_session_connect_seconds', 'Time to connect and authorize a Telethon session'
+)
+CLAIM_TO_SEND = REGISTRY.histogram(
+    'tg_worker_claim_to_send_seconds', 'Time from claiming a job to sending its message',
+    buckets=CLAIM_TO_SEND_BUCKETS
+)
+
+
+class MetricsServer:
+    """Serves REGISTRY as Prometheus text on /metrics and samples event-loop lag."""
+
+    def __init__(self, config, job_queue, session_manager, message_sender):
+        self.config = config
+        self.loop_lag_sec = 0.0
+        self.runner: Optional[web.AppRunner] = None
+        self.lag_task = None
+
+        REGISTRY.gauge('tg_worker_prefetch_depth', 'Prefetched jobs waiting to be dispatched',
+                       lambda: len(job_queue))
+        REGISTRY.gauge('tg_worker_parked_jobs', 'Claimed jobs held back for cooling accounts',
+                       lambda: len(job_queue.parked))
+        REGISTRY.gauge('tg_worker_cached_templates', 'Message templates held in the template cache',
+                       lambda: len(job_queue.template_cache))
+        REGISTRY.gauge('tg_worker_jobs_in_flight', 'Jobs dispatched to session lanes and not yet finished',
+                       lambda: message_sender.in_flight)
+        REGISTRY.gauge('tg_worker_connected_clients', 'Connected Telethon clients',
+                       lambda: len(session_manager.get_active_sessions()))
+        REGISTRY.gauge('tg_worker_unauthorized_sessions', 'Sessions excluded from claims until their file changes',
+                       lambda: len(session_manager.get_unauthorized_sessions()))
+        REGISTRY.gauge('tg_worker_degraded_sessions', 'Pooled sessions reconnecting in the background',
+                       lambda: len(session_manager.degraded))
+        REGISTRY.gauge('tg_worker_sessions_in_cooldown', 'Sessions currently in FloodWait cooldown',
+                       lambda: len(session_manager.cooldowns))
+        REGISTRY.gauge('tg_worker_event_loop_lag_seconds', 'Delay of the last event-loop lag probe',
+                       lambda: self.loop_lag_sec)
+
+    async def start(self):
+        if not self.config.metrics_enabled:
+            return
+
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.config.metrics_host, self.config.metrics_port)
+        try:
+            await site.start()
+        except OSError as e:
+            # Typically a second worker on the host with the same fixed port
+            logger.error(f"Metrics disabled, cannot listen on "
+                         f"{self.config.metrics_host}:{self.config.metrics_port}: {e}")
+            await self.runner.cleanup()
+            self.runner = None
+            return
+
+        self.lag_task = asyncio.create_task(self._lag_loop())
+        logger.info(f"Metrics available at http://{self.config.metrics_host}:{self.config.metrics_port}/metrics")
+
+    async def stop(self):
+        if self.lag_task:
+            self.lag_task.cancel()
+            try:
+                await self.lag_task
+            except asyncio.CancelledError:
+                pass
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8')
+
+    async def _lag_loop(self):
+        # How late a callback scheduled for "now" actually runs
+        loop = asyncio.get_running_loop()
+        interval_sec = self.config.metrics_lag_interval_ms / 1000
+        while True:
+            await asyncio.sleep(interval_sec)
+            started = time.monotonic()
+            future = loop.create_future()
+            loop.call_soon(future.set_result, None)
+            await future
+            self.loop_lag_sec = time.monotonic() - started
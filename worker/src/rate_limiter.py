@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class WindowCounter:
+    """Sliding-window event count over a ring buffer of fixed-width time buckets."""
+
+    def __init__(self, window_sec: float, bucket_count: int):
+        self.bucket_sec = window_sec / bucket_count
+        self.buckets = [0] * bucket_count
+        self.total = 0
+        self.head = int(time.time() // self.bucket_sec)
+
+    def _advance(self, now: float):
+        current = int(now // self.bucket_sec)
+        if current <= self.head:
+            return
+        # Clear buckets that slid out of the window; bounded by the ring size
+        steps = min(current - self.head, len(self.buckets))
+        for offset in range(1, steps + 1):
+            index = (self.head + offset) % len(self.buckets)
+            self.total -= self.buckets[index]
+            self.buckets[index] = 0
+        self.head = current
+
+    def add(self, count: int = 1, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        self._advance(now)
+        self.buckets[self.head % len(self.buckets)] += count
+        self.total += count
+
+    def count(self, now: Optional[float] = None) -> int:
+        self._advance(time.time() if now is None else now)
+        return self.total
+
+    def seconds_until_release(self, now: Optional[float] = None) -> float:
+        """Time until the oldest counted event leaves the window."""
+        now = time.time() if now is None else now
+        self._advance(now)
+        size = len(self.buckets)
+        for offset in range(1, size + 1):
+            bucket = self.head - size + offset
+            if self.buckets[bucket % size]:
+                return max((bucket + size) * self.bucket_sec - now, 0)
+        return 0
+
+    def to_dict(self) -> Dict:
+        return {'head': self.head, 'buckets': self.buckets}
+
+    def load_dict(self, data: Dict):
+        if len(data.get('buckets', [])) != len(self.buckets):
+            return
+        self.head = data['head']
+        self.buckets = list(data['buckets'])
+        self.total = sum(self.buckets)
+        self._advance(time.time())
+
+
+class GlobalRateLimiter:
+    """Enforces global_hourly_limit/global_daily_limit for the whole worker, persisted to disk."""
+
+    def __init__(self, config):
+        self.hourly_limit = config.global_hourly_limit
+        self.daily_limit = config.global_daily_limit
+        self.state_file = Path(config.rate_limit_state_file)
+        self.save_interval_sec = 5
+        self.last_saved = 0.0
+        self.hourly = WindowCounter(3600, 60)
+        self.daily = WindowCounter(86400, 288)
+        # Sends admitted by reserve() that haven't been recorded or released yet
+        self.reserved = 0
+        self.load()
+
+    def remaining(self) -> int:
+        remaining = []
+        if self.hourly_limit and self.hourly_limit > 0:
+            remaining.append(self.hourly_limit - self.hourly.count() - self.reserved)
+        if self.daily_limit and self.daily_limit > 0:
+            remaining.append(self.daily_limit - self.daily.count() - self.reserved)
+        return max(min(remaining), 0) if remaining else 2 ** 31
+
+    def allow(self) -> bool:
+        return self.remaining() > 0
+
+    def reserve(self) -> bool:
+        """Hold a slot for a send about to start, so parallel lanes can't all take the last one."""
+        if not self.allow():
+            return False
+        self.reserved += 1
+        return True
+
+    def release(self):
+        """Give back a reserve()d slot; call after record() or when the send didn't happen."""
+        self.reserved = max(self.reserved - 1, 0)
+
+    def seconds_until_available(self) -> float:
+        waits = []
+        if self.hourly_limit and self.hourly_limit > 0 and self.hourly.count() >= self.hourly_limit:
+            waits.append(self.hourly.seconds_until_release())
+        if self.daily_limit and self.daily_limit > 0 and self.daily.count() >= self.daily_limit:
+            waits.append(self.daily.seconds_until_release())
+        return max(waits) if waits else 0
+
+    def record(self, count: int = 1):
+        now = time.time()
+        self.hourly.add(count, now)
+        self.daily.add(count, now)
+        if now - self.last_saved >= self.save_interval_sec:
+            self.save()
+
+    def load(self):
+        if not self.state_file.exists():
+            return
+        try:
+            data = json.loads(self.state_file.read_text())
+            self.hourly.load_dict(data.get('hourly', {}))
+            self.daily.load_dict(data.get('daily', {}))
+            logger.info(f"Restored rate limit state: {self.hourly.count()} sent this hour, "
+                        f"{self.daily.count()} today")
+        except Exception as e:
+            logger.error(f"Failed to load rate limit state from {self.state_file}: {e}")
+
+    def save(self):
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.state_file.with_suffix('.tmp')
+            tmp_file.write_text(json.dumps({
+                'hourly': self.hourly.to_dict(),
+                'daily': self.daily.to_dict()
+            }))
+            # Atomic replace so a crash never leaves a truncated state file
+            os.replace(tmp_file, self.state_file)
+            self.last_saved = time.time()
+        except Exception as e:
+            logger.error(f"Failed to save rate limit state to {self.state_file}: {e}")
@@ -0,0 +1,265 @@
+"""
+Persisted index of the session files under sessions_root_dir.
+
+The manifest (session key -> path, mtime, size) is loaded at startup instead of
+walking every session folder. The root folder is listed once at startup and
+afterwards only when its own mtime changed; only folders missing from the
+manifest are stat'ed. Individual entries are re-checked lazily: on a lookup
+miss, when a session fails to load, and when a watcher reports a change under
+that session's folder.
+
+Changes are followed with watchdog (inotify, ReadDirectoryChangesW, FSEvents)
+when it is installed, and otherwise by polling the root folder, the folders
+still waiting for their session file, and a rolling slice of entries.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+# Entries re-checked per poll when falling back to polling
+POLL_SWEEP_SIZE = 256
+
+
+class SessionEntry:
+    __slots__ = ('path', 'mtime', 'size')
+
+    def __init__(self, path: str, mtime: float, size: int):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+
+
+class _RootEventHandler(FileSystemEventHandler):
+    """Forwards watchdog events from its observer thread to the index's loop."""
+
+    def __init__(self, index: 'SessionIndex', loop: asyncio.AbstractEventLoop):
+        self.index = index
+        self.loop = loop
+
+    def on_any_event(self, event):
+        for path in (event.src_path, getattr(event, 'dest_path', '')):
+            session_key = self.index.key_for_path(path)
+            if session_key:
+                self.loop.call_soon_threadsafe(self.index.on_watch_event, session_key)
+
+
+class SessionIndex:
+    def __init__(self, config):
+        self.config = config
+        self.root = Path(config.sessions_root_dir)
+        self.extension = config.session_extension
+        self.manifest_file = Path(config.session_manifest_file)
+        self.watch_mode = config.session_watch
+        self.poll_interval_sec = config.session_watch_poll_sec
+        self.entries: Dict[str, SessionEntry] = {}
+        self.root_mtime = 0.0
+        # Folders created ahead of their session file; adding the file doesn't touch the root mtime
+        self.empty_folders = set()
+        self.dirty = False
+        self.observer = None
+        self.task = None
+        self.sweep_cursor = 0
+        self.stats = {'index_hits': 0, 'index_misses': 0, 'index_rescans': 0, 'index_watch_events': 0}
+
+    async def start(self):
+        loaded = self.load()
+        # The manifest can't know about files dropped into existing folders while we were down
+        self.reconcile(force=True)
+        self.save()
+
+        if self.watch_mode == 'off':
+            mode = 'off'
+        elif self.watch_mode == 'auto' and Observer is not None and self.root.is_dir():
+            self._start_observer()
+            mode = 'native'
+        else:
+            mode = 'poll'
+
+        if mode != 'off':
+            self.task = asyncio.create_task(self._maintenance_loop(poll=mode == 'poll'))
+
+        logger.info(f"Session index: {len(self.entries)} session(s) "
+                    f"({'manifest' if loaded else 'full scan'}, watch={mode})")
+
+    async def stop(self):
+        if self.observer:
+            self.observer.stop()
+            await asyncio.get_running_loop().run_in_executor(None, self.observer.join, 5)
+            self.observer = None
+
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+        self.save()
+
+    def load(self) -> bool:
+        if not self.manifest_file.exists():
+            return False
+        try:
+            data = json.loads(self.manifest_file.read_text(encoding='utf-8'))
+            if data.get('root') != str(self.root):
+                logger.info("Session manifest was built for another root, rebuilding")
+                return False
+            self.entries = {key: SessionEntry(path, mtime, size)
+                            for key, path, mtime, size in data['sessions']}
+            self.root_mtime = data.get('root_mtime', 0.0)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to load session manifest: {e}")
+            self.entries = {}
+            self.root_mtime = 0.0
+            return False
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+            # Per-process temp name: the monitor's shards may save concurrently
+            tmp_file = self.manifest_file.with_suffix(f'.{os.getpid()}.tmp')
+            tmp_file.write_text(json.dumps({
+                'root': str(self.root),
+                'root_mtime': self.root_mtime,
+                'sessions': [[key, entry.path, entry.mtime, entry.size]
+                             for key, entry in self.entries.items()]
+            }, separators=(',', ':')), encoding='utf-8')
+            os.replace(tmp_file, self.manifest_file)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save session manifest: {e}")
+
+    def reconcile(self, force: bool = False) -> bool:
+        """List the root folder if forced or its mtime moved, i.e. folders were added or removed."""
+        try:
+            root_mtime = self.root.stat().st_mtime
+        except OSError:
+            if self.entries:
+                self.entries.clear()
+                self.dirty = True
+            return False
+
+        if root_mtime == self.root_mtime and not force:
+            return False
+
+        self.stats['index_rescans'] += 1
+        with os.scandir(self.root) as folders:
+            names = {folder.name for folder in folders if folder.is_dir()}
+
+        for session_key in list(self.entries):
+            if session_key not in names:
+                del self.entries[session_key]
+                self.dirty = True
+        for session_key in names - self.entries.keys():
+            self._stat(session_key)
+        self.empty_folders = names - self.entries.keys()
+
+        if root_mtime != self.root_mtime:
+            self.root_mtime = root_mtime
+            self.dirty = True
+        return True
+
+    def _stat(self, session_key: str) -> Optional[SessionEntry]:
+        path = self.config.get_session_path(session_key)
+        try:
+            st = path.stat()
+        except OSError:
+            if self.entries.pop(session_key, None):
+                self.dirty = True
+                if path.parent.is_dir():
+                    self.empty_folders.add(session_key)
+            return None
+
+        self.empty_folders.discard(session_key)
+        entry = self.entries.get(session_key)
+        if not entry or entry.mtime != st.st_mtime or entry.size != st.st_size:
+            entry = SessionEntry(str(path), st.st_mtime, st.st_size)
+            self.entries[session_key] = entry
+            self.dirty = True
+        return entry
+
+    def get(self, session_key: str) -> Optional[Path]:
+        """Session file path from the manifest; only a miss touches the filesystem."""
+        entry = self.entries.get(session_key)
+        if entry:
+            self.stats['index_hits'] += 1
+            return Path(entry.path)
+
+        self.stats['index_misses'] += 1
+        entry = self._stat(session_key)
+        return Path(entry.path) if entry else None
+
+    def invalidate(self, session_key: str):
+        """Re-check one entry after its session failed to load."""
+        self._stat(session_key)
+
+    def sessions(self) -> List[Dict]:
+        return [{'session_key': key, 'path': Path(entry.path)} for key, entry in self.entries.items()]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key_for_path(self, path) -> Optional[str]:
+        """Session key for a session folder or its session file, None for anything else."""
+        try:
+            parts = Path(os.fsdecode(path)).relative_to(self.root).parts
+        except ValueError:
+            return None
+        if len(parts) == 1 or (len(parts) == 2 and parts[1] == f"{parts[0]}{self.extension}"):
+            return parts[0]
+        return None
+
+    def on_watch_event(self, session_key: str):
+        self.stats['index_watch_events'] += 1
+        self._stat(session_key)
+
+    def _start_observer(self):
+        handler = _RootEventHandler(self, asyncio.get_running_loop())
+        self.observer = Observer()
+        self.observer.daemon = True
+        self.observer.schedule(handler, str(self.root), recursive=True)
+        self.observer.start()
+
+    def _poll(self):
+        self.reconcile()
+
+        # Folders still waiting for the operator to drop their session file in
+        for session_key in list(self.empty_folders):
+            self._stat(session_key)
+
+        # Catch replaced or deleted session files a slice at a time
+        keys = list(self.entries)
+        if not keys:
+            return
+        if self.sweep_cursor >= len(keys):
+            self.sweep_cursor = 0
+        for session_key in keys[self.sweep_cursor:self.sweep_cursor + POLL_SWEEP_SIZE]:
+            self._stat(session_key)
+        self.sweep_cursor += POLL_SWEEP_SIZE
+
+    async def _maintenance_loop(self, poll: bool):
+        while True:
+            await asyncio.sleep(self.poll_interval_sec)
+            try:
+                if poll:
+                    self._poll()
+                # Watch events only mark the manifest dirty; write it at most once per interval
+                self.save()
+            except Exception as e:
+                logger.error(f"Error in session index loop: {e}")
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lowest priority first: these are dropped first when the buffer is full or the API is slow
+LEVEL_PRIORITY = {'info': 0, 'success': 1, 'warning': 2, 'error': 3}
+# Accept every level again once the API has gone this long without a failed or slow flush
+DEGRADED_RECOVERY_SEC = 30
+
+class SessionLogShipper:
+    """Bounded, per-process buffer of session script logs shipped in batches via log-batch."""
+
+    def __init__(self, config, api_client):
+        self.api_client = api_client
+        self.capacity = config.session_log_buffer_size
+        self.batch_size = config.session_log_batch_size
+        self.flush_interval_sec = config.session_log_flush_interval_ms / 1000
+        self.slow_flush_sec = config.session_log_slow_flush_ms / 1000
+        self.max_message_len = config.session_log_max_message_len
+        # (priority, entry) in arrival order
+        self.entries: deque = deque()
+        # Raised to 'warning' while the API is failing or slow, so only problems are kept
+        self.min_priority = 0
+        self.degraded_at = 0.0
+        self.flush_event = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.running = False
+        self.task = None
+        self.dropped = Counter()
+        self.stats = {'shipped': 0, 'flushes': 0, 'failed_flushes': 0}
+
+    async def start(self):
+        self.running = True
+        self.task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Session log shipper started (capacity={self.capacity})")
+
+    async def stop(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+        # Drain what's left; give up on the first failure rather than hang shutdown
+        while self.entries:
+            if not await self.flush():
+                break
+        if self.entries or self.dropped:
+            logger.warning(f"Session log shipper stopped with {len(self.entries)} unsent "
+                           f"and {sum(self.dropped.values())} dropped log(s): {dict(self.dropped)}")
+
+    def add(self, session_id: str, log_level: str, message: str, details: Optional[Dict] = None):
+        priority = LEVEL_PRIORITY.get(log_level, 0)
+        if priority < self.min_priority:
+            self.dropped[log_level] += 1
+            return
+
+        if len(self.entries) >= self.capacity and not self._drop_below(priority):
+            # Everything buffered is at least as important as this entry
+            self.dropped[log_level] += 1
+            return
+
+        self.entries.append((priority, {
+            'session_id': session_id,
+            'log_level': log_level,
+            'message': message[:self.max_message_len],
+            'details': details or {},
+            'created_at': datetime.now(timezone.utc).isoformat()
+        }))
+
+        if len(self.entries) >= self.batch_size:
+            self.flush_event.set()
+
+    def _drop_below(self, priority: int) -> bool:
+        # Evict the oldest entry of the lowest level that is not above the incoming one
+        for level_priority in range(priority + 1):
+            for i, (entry_priority, entry) in enumerate(self.entries):
+                if entry_priority == level_priority:
+                    del self.entries[i]
+                    self.dropped[entry['log_level']] += 1
+                    return True
+        return False
+
+    async def flush(self) -> bool:
+        async with self.flush_lock:
+            # Checked on every tick, so an idle or warning-free shipper still recovers
+            if self.min_priority and time.monotonic() - self.degraded_at >= DEGRADED_RECOVERY_SEC:
+                self.min_priority = 0
+
+            if not self.entries:
+                return True
+
+            batch: List[tuple] = [self.entries.popleft()
+                                  for _ in range(min(self.batch_size, len(self.entries)))]
+            self.flush_event.clear()
+
+            started = time.monotonic()
+            success = await self.api_client.log_sessions([entry for _, entry in batch])
+            elapsed = time.monotonic() - started
+
+            if success:
+                self.stats['flushes'] += 1
+                self.stats['shipped'] += len(batch)
+                if elapsed > self.slow_flush_sec:
+                    self._degrade()
+                else:
+                    self.min_priority = 0
+            else:
+                self.stats['failed_flushes'] += 1
+                self._degrade()
+                self._requeue(batch)
+
+            # After a failure, wait for the next interval instead of retrying at once
+            if success and len(self.entries) >= self.batch_size:
+                self.flush_event.set()
+            return success
+
+    def _degrade(self):
+        self.min_priority = LEVEL_PRIORITY['warning']
+        self.degraded_at = time.monotonic()
+
+    def _requeue(self, batch: List[tuple]):
+        # Put the batch back in front, keeping only what fits and matters now
+        kept = []
+        for priority, entry in batch:
+            if priority >= self.min_priority:
+                kept.append((priority, entry))
+            else:
+                self.dropped[entry['log_level']] += 1
+        self.entries.extendleft(reversed(kept))
+        while len(self.entries) > self.capacity:
+            if not self._drop_below(LEVEL_PRIORITY['error']):
+                break
+
+    async def _flush_loop(self):
+        while self.running:
+            try:
+                await asyncio.wait_for(self.flush_event.wait(), timeout=self.flush_interval_sec)
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error in session log flush loop: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'buffered': len(self.entries), 'dropped': dict(self.dropped)}
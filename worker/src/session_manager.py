@@ -1,39 +1,115 @@
 import logging
+import random
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from telethon import TelegramClient
 from telethon.errors import FloodWaitError, AuthKeyError, PhoneNumberBannedError
 import asyncio
 
+from cooldown_index import CooldownIndex
+from session_index import SessionIndex
+from metrics import SESSION_CONNECT
+
 logger = logging.getLogger(__name__)
 
 class SessionManager:
     def __init__(self, config):
         self.config = config
-        self.clients: Dict[str, TelegramClient] = {}
-        self.cooldowns: Dict[str, float] = {}
+        # Connected clients in least- to most-recently-used order
+        self.clients: OrderedDict[str, TelegramClient] = OrderedDict()
+        self.last_used: Dict[str, float] = {}
+        # session_key -> lanes currently sending on it; pinned clients are never disconnected
+        self.pinned: Dict[str, int] = {}
+        self.cooldowns = CooldownIndex()
+        self.index = SessionIndex(config)
+        # session_key -> indexed mtime of the file that failed to authorize
+        self.unauthorized: Dict[str, Optional[float]] = {}
+        self.max_clients = config.max_clients
+        self.idle_timeout_sec = config.idle_timeout_sec
+        self.reaper_task = None
+        # One supervisor per pooled client keeps it connected; sessions it is
+        # still reconnecting are degraded and get no jobs
+        self.supervisors: Dict[str, asyncio.Task] = {}
+        self.degraded: set = set()
+        self.reconnect_base_delay_sec = config.reconnect_base_delay_sec
+        self.reconnect_max_delay_sec = config.reconnect_max_delay_sec
+        self.pool_stats = {
+            'pool_hits': 0,
+            'pool_misses': 0,
+            'pool_evictions': 0,
+            'pool_idle_disconnects': 0,
+            'pool_reconnects': 0
+        }
+
+    async def start(self):
+        await self.index.start()
+        self.reaper_task = asyncio.create_task(self._idle_reaper_loop())
+        logger.info(f"Session pool started (max_clients={self.max_clients}, idle_timeout={self.idle_timeout_sec}s)")
+
+    async def _idle_reaper_loop(self):
+        interval = max(self.idle_timeout_sec / 4, 5)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                cutoff = time.monotonic() - self.idle_timeout_sec
+                # Oldest entries come first, so stop at the first recently used one
+                for session_key in list(self.clients.keys()):
+                    if self.last_used.get(session_key, 0) > cutoff:
+                        break
+                    if self.pinned.get(session_key):
+                        continue
+                    logger.info(f"Disconnecting idle session: {session_key}")
+                    await self.close_client(session_key)
+                    self.pool_stats['pool_idle_disconnects'] += 1
+            except Exception as e:
+                logger.error(f"Error in session idle reaper: {e}")
+
+    def _touch(self, session_key: str):
+        self.clients.move_to_end(session_key)
+        self.last_used[session_key] = time.monotonic()
+
+    def pin(self, session_key: str):
+        """Keep a session's client connected while a lane is using it."""
+        self.pinned[session_key] = self.pinned.get(session_key, 0) + 1
+
+    def unpin(self, session_key: str):
+        count = self.pinned.get(session_key, 0) - 1
+        if count > 0:
+            self.pinned[session_key] = count
+        else:
+            self.pinned.pop(session_key, None)
+
+    async def _evict_lru(self):
+        while len(self.clients) > self.max_clients:
+            session_key = next((key for key in self.clients if not self.pinned.get(key)), None)
+            if session_key is None:
+                # Every pooled client is mid-send; the pool shrinks on a later open
+                break
+            logger.info(f"Evicting least recently used session: {session_key}")
+            await self.close_client(session_key)
+            self.pool_stats['pool_evictions'] += 1
 
     def discover_sessions(self) -> list:
-        return self.config.discover_sessions()
+        return self.index.sessions()
 
     async def get_client(self, session_key: str, api_id: int = None, api_hash: str = None) -> Optional[TelegramClient]:
         if session_key in self.clients:
-            client = self.clients[session_key]
-            if client.is_connected():
-                return client
-            else:
-                # Reconnect
-                try:
-                    await client.connect()
-                    return client
-                except Exception as e:
-                    logger.error(f"Failed to reconnect session {session_key}: {e}")
-                    del self.clients[session_key]
+            self._touch(session_key)
+            if session_key in self.degraded:
+                # Its supervisor is reconnecting; don't make the caller wait for it
+                return None
+            self.pool_stats['pool_hits'] += 1
+            return self.clients[session_key]
 
-        # Create new client
-        session_path = self.config.get_session_path(session_key)
-        if not session_path.exists():
-            logger.error(f"Session file not found: {session_path}")
+        self.pool_stats['pool_misses'] += 1
+        return await self._open_client(session_key, api_id, api_hash)
+
+    async def _open_client(self, session_key: str, api_id: int = None, api_hash: str = None) -> Optional[TelegramClient]:
+        session_path = self.index.get(session_key)
+        if session_path is None:
+            logger.error(f"Session file not found for {session_key} under {self.config.sessions_root_dir}")
             return None
 
         # Use default API credentials if not provided
@@ -43,56 +119,152 @@ class SessionManager:
             api_id = 12345
             api_hash = "placeholder_hash"
 
+        started = time.monotonic()
         try:
             client = TelegramClient(str(session_path.parent / session_key), api_id, api_hash)
             await client.connect()
 
             if not await client.is_user_authorized():
                 logger.error(f"Session {session_key} is not authorized")
+                await client.disconnect()
+                self._mark_unauthorized(session_key)
                 return None
 
+            SESSION_CONNECT.observe(time.monotonic() - started)
+            self.unauthorized.pop(session_key, None)
             self.clients[session_key] = client
+            self._touch(session_key)
+            self.supervisors[session_key] = asyncio.create_task(self._supervise(session_key, client))
             logger.info(f"Successfully loaded session: {session_key}")
+            await self._evict_lru()
             return client
 
         except AuthKeyError as e:
             logger.error(f"Auth key error for session {session_key}: {e}")
+            self._mark_unauthorized(session_key)
             return None
         except PhoneNumberBannedError as e:
             logger.error(f"Phone number banned for session {session_key}: {e}")
+            self._mark_unauthorized(session_key)
             return None
         except Exception as e:
             logger.error(f"Failed to load session {session_key}: {e}")
             return None
 
+    async def _supervise(self, session_key: str, client: TelegramClient):
+        failures = 0
+        while True:
+            if client.is_connected():
+                if session_key in self.degraded:
+                    self.degraded.discard(session_key)
+                    self.pool_stats['pool_reconnects'] += 1
+                    logger.info(f"Session {session_key} reconnected after {failures} failed attempt(s)")
+                failures = 0
+                try:
+                    # Resolves (or raises) once Telethon gives up on the connection
+                    await client.disconnected
+                except Exception as e:
+                    logger.warning(f"Session {session_key} disconnected: {e}")
+                else:
+                    logger.warning(f"Session {session_key} disconnected")
+                if client.is_connected():
+                    # Not actually down; don't spin on an already resolved future
+                    await asyncio.sleep(self.reconnect_base_delay_sec)
+                continue
+
+            self.degraded.add(session_key)
+            if failures:
+                # Jittered exponential backoff so dropped sessions don't reconnect in lockstep
+                delay = min(self.reconnect_base_delay_sec * 2 ** (failures - 1), self.reconnect_max_delay_sec)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            try:
+                await client.connect()
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Reconnect {failures} failed for session {session_key}: {e}")
+
+    def is_ready(self, session_key: str) -> bool:
+        """False only for pooled sessions whose connection is being re-established."""
+        return session_key not in self.degraded
+
+    def get_degraded_sessions(self) -> set:
+        return set(self.degraded)
+
+    def _mark_unauthorized(self, session_key: str):
+        # The file may have been removed or replaced since it was indexed
+        self.index.invalidate(session_key)
+        entry = self.index.entries.get(session_key)
+        self.unauthorized[session_key] = entry.mtime if entry else None
+
+    def get_unauthorized_sessions(self) -> set:
+        """Sessions that failed authorization and whose file hasn't been replaced since."""
+        unauthorized = set()
+        for session_key, mtime in self.unauthorized.items():
+            entry = self.index.entries.get(session_key)
+            if entry is None or entry.mtime == mtime:
+                unauthorized.add(session_key)
+        return unauthorized
+
+    async def warm_up(self, session_keys: List[str], concurrency: int) -> Dict[str, Optional[float]]:
+        """Connect and authorize sessions concurrently; returns seconds per session, None if it failed."""
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        report: Dict[str, Optional[float]] = {}
+
+        async def warm(session_key: str):
+            async with semaphore:
+                started = time.monotonic()
+                client = await self._open_client(session_key)
+                elapsed = time.monotonic() - started
+                report[session_key] = elapsed if client else None
+                if client:
+                    logger.info(f"Warmed session {session_key} in {elapsed * 1000:.0f} ms")
+
+        await asyncio.gather(*(warm(key) for key in session_keys if key not in self.clients))
+        return report
+
     async def close_client(self, session_key: str):
-        if session_key in self.clients:
+        client = self.clients.pop(session_key, None)
+        self.last_used.pop(session_key, None)
+        self.degraded.discard(session_key)
+        supervisor = self.supervisors.pop(session_key, None)
+        if supervisor:
+            supervisor.cancel()
             try:
-                await self.clients[session_key].disconnect()
-                del self.clients[session_key]
+                await supervisor
+            except asyncio.CancelledError:
+                pass
+        if client:
+            try:
+                await client.disconnect()
                 logger.info(f"Closed session: {session_key}")
             except Exception as e:
                 logger.error(f"Error closing session {session_key}: {e}")
 
     async def close_all(self):
+        if self.reaper_task:
+            self.reaper_task.cancel()
+            try:
+                await self.reaper_task
+            except asyncio.CancelledError:
+                pass
+
         for session_key in list(self.clients.keys()):
             await self.close_client(session_key)
 
+        await self.index.stop()
+
     def set_cooldown(self, session_key: str, seconds: float):
-        import time
-        self.cooldowns[session_key] = time.time() + seconds
+        self.cooldowns.set(session_key, seconds)
         logger.info(f"Set cooldown for {session_key}: {seconds} seconds")
 
     def is_in_cooldown(self, session_key: str) -> bool:
-        import time
-        if session_key not in self.cooldowns:
-            return False
+        return self.cooldowns.is_cooling(session_key)
 
-        if time.time() >= self.cooldowns[session_key]:
-            del self.cooldowns[session_key]
-            return False
-
-        return True
+    def get_cooling_sessions(self) -> set:
+        return self.cooldowns.cooling_sessions()
 
     def get_active_sessions(self) -> list:
         return [key for key, client in self.clients.items() if client.is_connected()]
+
+    def get_pool_stats(self) -> Dict[str, int]:
+        return {**self.pool_stats, 'pool_size': len(self.clients)}
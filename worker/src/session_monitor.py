@@ -5,7 +5,7 @@ Manages multiple session scripts and coordinates their execution.
 
 import asyncio
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 import subprocess
 import signal
@@ -13,6 +13,8 @@ import signal
 from config import WorkerConfig
 from api_client import TGMarketerAPIClient
 from session_script import run_session_script
+from session_log_shipper import SessionLogShipper
+from session_index import SessionIndex
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +26,8 @@ class SessionMonitor:
         self.config = config
         self.api_client = api_client
         self.running_scripts: Dict[str, asyncio.Task] = {}
+        self.log_shipper = SessionLogShipper(config, api_client)
+        self.session_index = SessionIndex(config)
         self.running = False
 
     async def start(self):
@@ -31,6 +35,12 @@ class SessionMonitor:
         logger.info("Starting session monitor")
         self.running = True
 
+        # Load the session manifest and follow changes to it
+        await self.session_index.start()
+
+        # Start shipping script logs in batches
+        await self.log_shipper.start()
+
         # Start monitoring loop
         await self.monitor_loop()
 
@@ -43,6 +53,11 @@ class SessionMonitor:
         for session_id in list(self.running_scripts.keys()):
             await self.stop_session_script(session_id)
 
+        # Ship whatever the scripts logged on the way out
+        await self.log_shipper.stop()
+
+        await self.session_index.stop()
+
     async def monitor_loop(self):
         """Main monitoring loop that checks for scripts to start/stop."""
         while self.running:
@@ -63,19 +78,7 @@ class SessionMonitor:
                         await self.stop_session_script(session_id)
 
                 # Clean up completed tasks
-                completed_ids = []
-                for session_id, task in self.running_scripts.items():
-                    if task.done():
-                        completed_ids.append(session_id)
-                        try:
-                            await task  # Raise any exceptions
-                        except Exception as e:
-                            logger.error(f"Script {session_id} failed: {e}")
-                            await self.mark_session_error(session_id, str(e))
-
-                for session_id in completed_ids:
-                    del self.running_scripts[session_id]
-                    await self.mark_session_stopped(session_id)
+                await self.reap_finished_scripts()
 
                 # Wait before next check
                 await asyncio.sleep(10)
@@ -84,6 +87,28 @@ class SessionMonitor:
                 logger.error(f"Error in monitor loop: {e}", exc_info=True)
                 await asyncio.sleep(30)
 
+    async def reap_finished_scripts(self) -> List[Tuple[str, Optional[str]]]:
+        """Drop scripts that have exited and return (session_id, error) for each."""
+        finished = []
+        for session_id, task in list(self.running_scripts.items()):
+            if not task.done():
+                continue
+            error = None
+            try:
+                await task  # Raise any exceptions
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                error = str(e)
+                logger.error(f"Script {session_id} failed: {e}")
+                await self.mark_session_error(session_id, error)
+
+            del self.running_scripts[session_id]
+            await self.mark_session_stopped(session_id)
+            finished.append((session_id, error))
+
+        return finished
+
     async def fetch_active_sessions(self) -> list:
         """Fetch sessions from the API."""
         try:
@@ -102,19 +127,19 @@ class SessionMonitor:
         logger.info(f"Starting script for session {session_key}")
 
         try:
-            # Build session file path
-            session_folder = Path(self.config.sessions_root_dir) / session_key
-            session_file = session_folder / f"{session_key}.session"
-
-            if not session_file.exists():
-                raise FileNotFoundError(f"Session file not found: {session_file}")
+            session_file = self.session_index.get(session_key)
+            if session_file is None:
+                raise FileNotFoundError(f"Session file not found for {session_key}")
 
             # Get script config from session
             script_config = session.get('script_config', {
                 'delay_min_sec': 2,
                 'delay_max_sec': 5,
                 'group_delay_sec': 12,
-                'max_messages_per_cycle': 50
+                'max_messages_per_cycle': 50,
+                'stats_flush_interval_sec': 30,
+                'stats_flush_every': 20,
+                'dialog_full_refresh_sec': 86400
             })
 
             # Create task to run the script
@@ -125,7 +150,8 @@ class SessionMonitor:
                     api_hash=self.config.telegram_api_hash,
                     config=script_config,
                     api_client=self.api_client,
-                    session_id=session_id
+                    session_id=session_id,
+                    log_shipper=self.log_shipper
                 )
             )
 
@@ -270,6 +296,28 @@ Do not manually edit or delete files unless you know what you're doing.
     return session_folder
 
 
+async def run_monitor(config_path: str):
+    """Run the session monitor until interrupted; sharded when session_shards > 1."""
+    # Imported here: session_shards builds on this module
+    from session_shards import create_session_monitor
+
+    config = WorkerConfig(config_path)
+    api_client = TGMarketerAPIClient(
+        config.api_url,
+        config.jwt_token,
+        config.worker_id,
+        request_timeout_sec=config.api_request_timeout_sec,
+        connect_timeout_sec=config.api_connect_timeout_sec,
+        max_connections=config.api_max_connections
+    )
+    monitor = create_session_monitor(config, api_client)
+    try:
+        await monitor.start()
+    finally:
+        await monitor.stop()
+        await api_client.close()
+
+
 if __name__ == '__main__':
     # Example usage
     import sys
@@ -292,9 +340,16 @@ if __name__ == '__main__':
             session_folder = Path(sys.argv[2])
             asyncio.run(launch_telegram_instance(session_folder))
 
+        elif action == 'run':
+            try:
+                asyncio.run(run_monitor(sys.argv[2] if len(sys.argv) >= 3 else 'config.toml'))
+            except KeyboardInterrupt:
+                pass
+
         else:
             print("Usage:")
             print("  python session_monitor.py create <root_dir> <telegram_user_id>")
             print("  python session_monitor.py launch <session_folder>")
+            print("  python session_monitor.py run [config.toml]")
     else:
         print("Session Monitor - use with appropriate arguments")
@@ -6,11 +6,15 @@ Retrieves messages from Saved Messages and posts to groups in round-robin fashio
 import asyncio
 import random
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from telethon import TelegramClient, errors
 from telethon.tl.types import Message, Chat, Channel
 
+from dialog_snapshot import DialogRecord, DialogSnapshot
+from template_store import SavedTemplateStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,7 +28,8 @@ class SessionScript:
         api_hash: str,
         config: Dict,
         api_client: Optional[any] = None,
-        session_id: Optional[str] = None
+        session_id: Optional[str] = None,
+        log_shipper: Optional[any] = None
     ):
         self.session_path = session_path
         self.api_id = api_id
@@ -32,11 +37,13 @@ class SessionScript:
         self.config = config
         self.api_client = api_client
         self.session_id = session_id
+        self.log_shipper = log_shipper
 
         self.client: Optional[TelegramClient] = None
         self.running = False
-        self.saved_messages: List[Message] = []
-        self.target_groups: List[Dict] = []
+        self.me = None
+        self.templates = SavedTemplateStore(limit=config.get('max_templates', 100))
+        self.target_groups: List[DialogRecord] = []
         self.current_group_index = 0
 
         # Script configuration
@@ -44,12 +51,24 @@ class SessionScript:
         self.delay_max = config.get('delay_max_sec', 5)
         self.group_delay = config.get('group_delay_sec', 12)
         self.max_messages_per_cycle = config.get('max_messages_per_cycle', 50)
+        self.stats_flush_interval = config.get('stats_flush_interval_sec', 30)
+        self.stats_flush_every = config.get('stats_flush_every', 20)
+        self.dialogs = DialogSnapshot(
+            f"{session_path}.dialogs.json",
+            full_refresh_sec=config.get('dialog_full_refresh_sec', 86400)
+        )
 
         # Statistics
         self.messages_sent = 0
         self.messages_failed = 0
         self.cycle_count = 0
 
+        # Counters not yet reported to the API, flushed as one increment
+        self.pending_sent = 0
+        self.pending_failed = 0
+        self.reported_groups: Optional[int] = None
+        self.last_stats_flush = time.monotonic()
+
     async def start(self):
         """Initialize and start the automation script."""
         try:
@@ -68,8 +87,10 @@ class SessionScript:
                 self.log_error("Session is not authorized")
                 raise Exception("Session not authorized")
 
-            me = await self.client.get_me()
-            self.log_info(f"Connected as {me.first_name} ({me.id})")
+            # Cached for the lifetime of the script
+            self.me = await self.client.get_me()
+            self.log_info(f"Connected as {self.me.first_name} ({self.me.id})")
+            self.templates.attach(self.client, self.me.id)
 
             # Load saved messages
             await self.load_saved_messages()
@@ -86,6 +107,8 @@ class SessionScript:
             self.log_error(f"Script error: {e}")
             raise
         finally:
+            await self.flush_stats()
+            self.templates.detach()
             if self.client:
                 await self.client.disconnect()
 
@@ -95,52 +118,35 @@ class SessionScript:
         self.running = False
 
     async def load_saved_messages(self):
-        """Load messages from Saved Messages."""
+        """Pick up new messages from Saved Messages."""
         try:
-            self.log_info("Loading messages from Saved Messages")
-
-            # Get "me" entity which represents Saved Messages
-            me = await self.client.get_me()
+            if not self.templates:
+                self.log_info("Loading messages from Saved Messages")
 
-            # Fetch messages from Saved Messages
-            messages = []
-            async for message in self.client.iter_messages('me', limit=100):
-                if message.text:  # Only text messages
-                    messages.append(message)
-
-            self.saved_messages = messages
-            self.log_info(f"Loaded {len(messages)} message(s) from Saved Messages")
+            # Only messages newer than the last sync; deletions and edits arrive as updates
+            added = await self.templates.sync(self.client)
+            if added:
+                self.log_info(f"Loaded {added} new message(s) from Saved Messages ({len(self.templates)} total)")
 
         except Exception as e:
             self.log_error(f"Failed to load saved messages: {e}")
             raise
 
     async def discover_groups(self):
-        """Discover all groups/channels the user is a member of."""
+        """Discover groups/channels, starting from the on-disk dialog snapshot."""
         try:
-            self.log_info("Discovering groups and channels")
-
-            groups = []
-            async for dialog in self.client.iter_dialogs():
-                # Check if it's a group or channel
-                if dialog.is_group or dialog.is_channel:
-                    # Check if we can send messages
-                    entity = dialog.entity
+            if not self.dialogs.records and self.dialogs.load():
+                self.log_info(f"Loaded {len(self.dialogs.records)} dialog(s) from snapshot")
 
-                    # Skip if we can't send messages
-                    if hasattr(entity, 'broadcast') and entity.broadcast and not hasattr(entity, 'creator'):
-                        continue
+            full = self.dialogs.needs_full_refresh()
+            self.log_info("Discovering groups and channels" if full else "Checking for new groups and channels")
+            changed = await self.dialogs.refresh(self.client)
 
-                    groups.append({
-                        'id': dialog.id,
-                        'title': dialog.title,
-                        'entity': entity
-                    })
+            self.target_groups = self.dialogs.writable()
+            self.current_group_index %= max(len(self.target_groups), 1)
+            self.log_info(f"Found {len(self.target_groups)} targetable group(s) ({changed} refreshed)")
 
-            self.target_groups = groups
-            self.log_info(f"Found {len(groups)} targetable group(s)")
-
-            if len(groups) == 0:
+            if len(self.target_groups) == 0:
                 self.log_warning("No groups found to send messages to")
 
         except Exception as e:
@@ -154,7 +160,7 @@ class SessionScript:
         while self.running:
             try:
                 # Check if we have messages and groups
-                if not self.saved_messages:
+                if not self.templates:
                     self.log_warning("No messages in Saved Messages, waiting...")
                     await asyncio.sleep(60)
                     await self.load_saved_messages()
@@ -166,7 +172,8 @@ class SessionScript:
                     await self.discover_groups()
                     continue
 
-                # Start a new cycle
+                # Start a new cycle, picking up templates saved since the last one
+                await self.load_saved_messages()
                 self.cycle_count += 1
                 self.log_info(f"Starting cycle {self.cycle_count}")
 
@@ -175,7 +182,10 @@ class SessionScript:
                 # Send messages in round-robin fashion
                 while messages_in_cycle < self.max_messages_per_cycle and self.running:
                     # Pick a random message
-                    message = random.choice(self.saved_messages)
+                    templates = self.templates.items()
+                    if not templates or not self.target_groups:
+                        break
+                    message = random.choice(templates)
 
                     # Get next group (round-robin)
                     group = self.target_groups[self.current_group_index]
@@ -186,13 +196,15 @@ class SessionScript:
 
                     if success:
                         self.messages_sent += 1
+                        self.pending_sent += 1
                         messages_in_cycle += 1
-
-                        # Update stats in API
-                        await self.update_stats(messages_sent=1)
                     else:
                         self.messages_failed += 1
-                        await self.update_stats(messages_failed=1)
+                        self.pending_failed += 1
+
+                    # Report stats in aggregate rather than once per message
+                    if self._stats_flush_due():
+                        await self.flush_stats()
 
                     # Random delay between messages
                     delay = random.uniform(self.delay_min, self.delay_max)
@@ -201,6 +213,7 @@ class SessionScript:
 
                 # Cycle complete
                 self.log_info(f"Cycle {self.cycle_count} complete. Sent {messages_in_cycle} messages")
+                await self.flush_stats()
 
                 # Wait before next cycle
                 cycle_delay = self.group_delay * len(self.target_groups)
@@ -216,73 +229,107 @@ class SessionScript:
                 self.log_error(f"Error in main loop: {e}")
                 await asyncio.sleep(30)
 
-    async def send_message(self, group: Dict, text: str) -> bool:
+    async def send_message(self, group: DialogRecord, text: str) -> bool:
         """Send a message to a specific group."""
         try:
-            await self.client.send_message(group['entity'], text)
-            self.log_success(f"Sent to {group['title']}")
+            await self.client.send_message(group.input_peer(), text)
+            self.log_success(f"Sent to {group.title}")
             return True
 
         except errors.FloodWaitError as e:
-            self.log_warning(f"FloodWait on {group['title']}: {e.seconds}s")
+            self.log_warning(f"FloodWait on {group.title}: {e.seconds}s")
             raise
 
         except errors.ChatWriteForbiddenError:
-            self.log_error(f"Cannot write to {group['title']} (forbidden)")
+            self.log_error(f"Cannot write to {group.title} (forbidden)")
+            self._drop_group(group)
             return False
 
         except errors.UserBannedInChannelError:
-            self.log_error(f"Banned in {group['title']}")
+            self.log_error(f"Banned in {group.title}")
+            self._drop_group(group)
             return False
 
         except Exception as e:
-            self.log_error(f"Failed to send to {group['title']}: {e}")
+            self.log_error(f"Failed to send to {group.title}: {e}")
             return False
 
+    def _drop_group(self, group: DialogRecord):
+        # Remembered in the snapshot so later starts don't target it either
+        self.dialogs.mark_unwritable(group.id)
+        self.dialogs.save()
+
+        # Stop targeting it in this run too, keeping the round-robin on the next group
+        for index, target in enumerate(self.target_groups):
+            if target.id == group.id:
+                del self.target_groups[index]
+                if index < self.current_group_index:
+                    self.current_group_index -= 1
+                self.current_group_index %= max(len(self.target_groups), 1)
+                break
+
+    def _ship_log(self, log_level: str, message: str):
+        # Buffered and shipped in batches by the process-wide SessionLogShipper
+        if self.log_shipper and self.session_id:
+            self.log_shipper.add(self.session_id, log_level, message)
+
     def log_info(self, message: str):
         """Log info message."""
         logger.info(message)
-        if self.api_client and self.session_id:
-            asyncio.create_task(self.api_client.log_session(
-                self.session_id, 'info', message
-            ))
+        self._ship_log('info', message)
 
     def log_success(self, message: str):
         """Log success message."""
         logger.info(message)
-        if self.api_client and self.session_id:
-            asyncio.create_task(self.api_client.log_session(
-                self.session_id, 'success', message
-            ))
+        self._ship_log('success', message)
 
     def log_warning(self, message: str):
         """Log warning message."""
         logger.warning(message)
-        if self.api_client and self.session_id:
-            asyncio.create_task(self.api_client.log_session(
-                self.session_id, 'warning', message
-            ))
+        self._ship_log('warning', message)
 
     def log_error(self, message: str):
         """Log error message."""
         logger.error(message)
-        if self.api_client and self.session_id:
-            asyncio.create_task(self.api_client.log_session(
-                self.session_id, 'error', message
-            ))
-
-    async def update_stats(self, messages_sent: int = 0, messages_failed: int = 0):
+        self._ship_log('error', message)
+
+    def _stats_flush_due(self) -> bool:
+        pending = self.pending_sent + self.pending_failed
+        return pending >= self.stats_flush_every or (
+            pending > 0 and time.monotonic() - self.last_stats_flush >= self.stats_flush_interval
+        )
+
+    async def flush_stats(self):
+        """Report accumulated counters as one increment."""
+        groups = len(self.target_groups)
+        if not self.pending_sent and not self.pending_failed and groups == self.reported_groups:
+            return
+
+        sent, failed = self.pending_sent, self.pending_failed
+        self.pending_sent = self.pending_failed = 0
+        self.last_stats_flush = time.monotonic()
+
+        if await self.update_stats(messages_sent=sent, messages_failed=failed):
+            self.reported_groups = groups
+        else:
+            # Keep the counts for the next flush
+            self.pending_sent += sent
+            self.pending_failed += failed
+
+    async def update_stats(self, messages_sent: int = 0, messages_failed: int = 0) -> bool:
         """Update statistics via API."""
-        if self.api_client and self.session_id:
-            try:
-                await self.api_client.update_session_stats(
-                    self.session_id,
-                    messages_sent=messages_sent,
-                    messages_failed=messages_failed,
-                    groups_targeted=len(self.target_groups)
-                )
-            except Exception as e:
-                logger.error(f"Failed to update stats: {e}")
+        if not (self.api_client and self.session_id):
+            return True
+        try:
+            return await self.api_client.update_session_stats(
+                self.session_id,
+                messages_sent=messages_sent,
+                messages_failed=messages_failed,
+                groups_targeted=len(self.target_groups)
+            )
+        except Exception as e:
+            logger.error(f"Failed to update stats: {e}")
+            return False
 
 
 async def run_session_script(
@@ -291,7 +338,8 @@ async def run_session_script(
     api_hash: str,
     config: Dict,
     api_client: Optional[any] = None,
-    session_id: Optional[str] = None
+    session_id: Optional[str] = None,
+    log_shipper: Optional[any] = None
 ):
     """
     Main entry point for running the session automation script.
@@ -303,8 +351,9 @@ async def run_session_script(
         config: Script configuration dict
         api_client: Optional API client for logging
         session_id: Optional session ID for logging
+        log_shipper: Optional SessionLogShipper that ships logs to the API
     """
-    script = SessionScript(session_path, api_id, api_hash, config, api_client, session_id)
+    script = SessionScript(session_path, api_id, api_hash, config, api_client, session_id, log_shipper)
 
     try:
         await script.start()
@@ -333,7 +382,10 @@ if __name__ == '__main__':
         'delay_min_sec': 2,
         'delay_max_sec': 5,
         'group_delay_sec': 12,
-        'max_messages_per_cycle': 50
+        'max_messages_per_cycle': 50,
+        'stats_flush_interval_sec': 30,
+        'stats_flush_every': 20,
+        'dialog_full_refresh_sec': 86400
     }
 
     # Setup logging
@@ -0,0 +1,250 @@
+"""
+Multi-process sharding for session scripts.
+
+ShardedSessionMonitor keeps SessionMonitor's control loop in the parent but
+runs the scripts themselves in N child processes, each with its own event
+loop, API client and log shipper. Sessions are assigned to shards by
+rendezvous hashing of the session id, so an assignment only moves when its
+shard is added or removed. Commands go down a per-shard queue; exits and
+stats come back on a shared event queue, and log records on a log queue that
+the parent replays through its own handlers.
+"""
+
+import asyncio
+import hashlib
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import WorkerConfig
+from api_client import TGMarketerAPIClient
+from session_monitor import SessionMonitor
+
+logger = logging.getLogger(__name__)
+
+# Seconds a shard gets to stop its scripts before it is terminated
+SHARD_STOP_TIMEOUT_SEC = 30
+SHARD_STATS_INTERVAL_SEC = 10
+
+
+def shard_for(session_id: str, shard_count: int) -> int:
+    """Rendezvous hash: stable across processes and restarts, unlike hash()."""
+    def weight(shard: int) -> bytes:
+        return hashlib.blake2b(f"{session_id}:{shard}".encode(), digest_size=8).digest()
+    return max(range(shard_count), key=weight)
+
+
+def run_shard(shard_index: int, config_path: str, commands, events, log_queue):
+    """Child process entry point."""
+    root_logger = logging.getLogger()
+    root_logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+
+    config = WorkerConfig(config_path)
+    root_logger.setLevel(getattr(logging, config.log_level))
+
+    try:
+        asyncio.run(_shard_loop(shard_index, config, commands, events))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _shard_loop(shard_index: int, config: WorkerConfig, commands, events):
+    api_client = TGMarketerAPIClient(
+        config.api_url,
+        config.jwt_token,
+        config.worker_id,
+        request_timeout_sec=config.api_request_timeout_sec,
+        connect_timeout_sec=config.api_connect_timeout_sec,
+        max_connections=config.api_max_connections
+    )
+    monitor = SessionMonitor(config, api_client)
+    monitor.running = True
+    # The parent keeps the manifest current; a shard only reads it and probes misses
+    monitor.session_index.load()
+    await monitor.log_shipper.start()
+    logger.info(f"Shard {shard_index} started")
+
+    loop = asyncio.get_running_loop()
+    last_stats = 0.0
+
+    try:
+        while True:
+            try:
+                command = await loop.run_in_executor(None, commands.get, True, 1.0)
+            except queue.Empty:
+                command = None
+
+            if command:
+                kind = command[0]
+                if kind == 'start':
+                    await monitor.start_session_script(command[1])
+                elif kind == 'stop':
+                    await monitor.stop_session_script(command[1])
+                elif kind == 'shutdown':
+                    break
+
+            for session_id, error in await monitor.reap_finished_scripts():
+                events.put(('exited', shard_index, session_id, error))
+
+            if time.monotonic() - last_stats >= SHARD_STATS_INTERVAL_SEC:
+                last_stats = time.monotonic()
+                events.put(('stats', shard_index, {
+                    'running': monitor.get_running_session_ids(),
+                    'logs': monitor.log_shipper.get_stats()
+                }))
+    finally:
+        await monitor.stop()
+        await api_client.close()
+        logger.info(f"Shard {shard_index} stopped")
+
+
+class _Shard:
+    __slots__ = ('index', 'process', 'commands')
+
+    def __init__(self, index: int, process, commands):
+        self.index = index
+        self.process = process
+        self.commands = commands
+
+
+class ShardedSessionMonitor(SessionMonitor):
+    """SessionMonitor whose scripts run in shard processes instead of local tasks."""
+
+    def __init__(self, config: WorkerConfig, api_client: TGMarketerAPIClient, shard_count: int):
+        super().__init__(config, api_client)
+        self.shard_count = shard_count
+        # spawn: same behaviour on Windows and POSIX, and no inherited event loop
+        self.context = multiprocessing.get_context('spawn')
+        self.events = self.context.Queue()
+        self.log_queue = self.context.Queue()
+        self.log_listener: Optional[logging.handlers.QueueListener] = None
+        self.shards: List[_Shard] = []
+        # session_id -> shard index, for scripts the parent asked to run
+        self.running_scripts: Dict[str, int] = {}
+        self.sessions: Dict[str, Dict] = {}
+        self.exited: List[Tuple[str, Optional[str]]] = []
+        self.shard_stats: Dict[int, Dict[str, Any]] = {}
+        self.event_task = None
+
+    async def start(self):
+        logger.info(f"Starting session monitor with {self.shard_count} shard(s)")
+        self.running = True
+        await self.session_index.start()
+
+        # Replay child log records through this process's handlers
+        self.log_listener = logging.handlers.QueueListener(
+            self.log_queue, *logging.getLogger().handlers, respect_handler_level=True
+        )
+        self.log_listener.start()
+
+        self.shards = [self._spawn(index) for index in range(self.shard_count)]
+        self.event_task = asyncio.create_task(self._event_loop())
+
+        await self.monitor_loop()
+
+    async def stop(self):
+        logger.info("Stopping sharded session monitor")
+        self.running = False
+
+        loop = asyncio.get_running_loop()
+        for shard in self.shards:
+            shard.commands.put(('shutdown',))
+        for shard in self.shards:
+            await loop.run_in_executor(None, shard.process.join, SHARD_STOP_TIMEOUT_SEC)
+            if shard.process.is_alive():
+                logger.warning(f"Shard {shard.index} did not stop in time, terminating")
+                shard.process.terminate()
+                await loop.run_in_executor(None, shard.process.join, 5)
+
+        if self.event_task:
+            self.event_task.cancel()
+            try:
+                await self.event_task
+            except asyncio.CancelledError:
+                pass
+
+        for session_id in list(self.running_scripts):
+            await self.mark_session_stopped(session_id)
+        self.running_scripts.clear()
+
+        await self.session_index.stop()
+
+        if self.log_listener:
+            self.log_listener.stop()
+
+    def _spawn(self, index: int) -> _Shard:
+        commands = self.context.Queue()
+        process = self.context.Process(
+            target=run_shard,
+            args=(index, str(self.config.config_path), commands, self.events, self.log_queue),
+            name=f"session-shard-{index}",
+            daemon=True
+        )
+        process.start()
+        logger.info(f"Spawned shard {index} (pid {process.pid})")
+        return _Shard(index, process, commands)
+
+    async def start_session_script(self, session: Dict):
+        session_id = session['id']
+        shard = self.shards[shard_for(session_id, self.shard_count)]
+        shard.commands.put(('start', session))
+        self.running_scripts[session_id] = shard.index
+        self.sessions[session_id] = session
+        logger.info(f"Assigned session {session_id} to shard {shard.index}")
+
+    async def stop_session_script(self, session_id: str):
+        shard_index = self.running_scripts.pop(session_id, None)
+        self.sessions.pop(session_id, None)
+        if shard_index is not None:
+            self.shards[shard_index].commands.put(('stop', session_id))
+
+    async def reap_finished_scripts(self) -> List[Tuple[str, Optional[str]]]:
+        self._restart_dead_shards()
+
+        finished, self.exited = self.exited, []
+        for session_id, _ in finished:
+            self.running_scripts.pop(session_id, None)
+            self.sessions.pop(session_id, None)
+        return finished
+
+    def _restart_dead_shards(self):
+        # A crashed shard only takes its own sessions down; respawn it and resend them
+        for shard in self.shards:
+            if shard.process.is_alive() or not self.running:
+                continue
+            logger.error(f"Shard {shard.index} exited with code {shard.process.exitcode}, restarting")
+            replacement = self._spawn(shard.index)
+            self.shards[shard.index] = replacement
+            for session_id, shard_index in self.running_scripts.items():
+                if shard_index == shard.index:
+                    replacement.commands.put(('start', self.sessions[session_id]))
+
+    async def _event_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                event = await loop.run_in_executor(None, self.events.get, True, 1.0)
+            except queue.Empty:
+                continue
+
+            kind, shard_index = event[0], event[1]
+            if kind == 'exited':
+                _, _, session_id, error = event
+                # Ignore exits of scripts that were since reassigned or restarted
+                if self.running_scripts.get(session_id) == shard_index:
+                    self.exited.append((session_id, error))
+            elif kind == 'stats':
+                self.shard_stats[shard_index] = event[2]
+
+    def get_shard_stats(self) -> Dict[int, Dict[str, Any]]:
+        return dict(self.shard_stats)
+
+
+def create_session_monitor(config: WorkerConfig, api_client: TGMarketerAPIClient) -> SessionMonitor:
+    """In-process monitor for one shard, a sharded supervisor for more."""
+    if config.session_shards > 1:
+        return ShardedSessionMonitor(config, api_client, config.session_shards)
+    return SessionMonitor(config, api_client)
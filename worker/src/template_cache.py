@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from job import Job
+
+logger = logging.getLogger(__name__)
+
+# Largest id list the templates action accepts in one request
+MAX_TEMPLATES_PER_REQUEST = 500
+# How long a template the API didn't return (or couldn't be fetched) is not asked for again
+UNAVAILABLE_RETRY_SEC = 30
+
+class TemplateCache:
+    """LRU of template_id -> (version, text), filled in bulk for each claimed batch.
+
+    Jobs carry only template_id and template_version. A cached body is used
+    while its version is at least the one the job references. Concurrent misses
+    for a template share one request, and a template that couldn't be had is
+    not requested again for UNAVAILABLE_RETRY_SEC.
+    """
+
+    def __init__(self, config, api_client):
+        self.api_client = api_client
+        self.capacity = config.template_cache_size
+        self.templates: 'OrderedDict[str, Tuple[int, str]]' = OrderedDict()
+        # template_id -> the fetch currently requesting it
+        self.fetching: Dict[str, asyncio.Future] = {}
+        # template_id -> monotonic time until which it is treated as unavailable
+        self.unavailable: Dict[str, float] = {}
+        self.stats = {'template_hits': 0, 'template_misses': 0, 'template_fetches': 0}
+
+    def __len__(self):
+        return len(self.templates)
+
+    def _lookup(self, template_id: str, version: int) -> Optional[str]:
+        entry = self.templates.get(template_id)
+        if entry is None or entry[0] < version:
+            return None
+        self.templates.move_to_end(template_id)
+        return entry[1]
+
+    def _is_unavailable(self, template_id: str) -> bool:
+        until = self.unavailable.get(template_id)
+        if until is None:
+            return False
+        if until > time.monotonic():
+            return True
+        del self.unavailable[template_id]
+        return False
+
+    def _put(self, template_id: str, version: int, text: str):
+        self.unavailable.pop(template_id, None)
+        self.templates[template_id] = (version, text)
+        self.templates.move_to_end(template_id)
+        while len(self.templates) > self.capacity:
+            self.templates.popitem(last=False)
+
+    async def _fetch(self, template_ids: Iterable[str]):
+        template_ids = list(template_ids)
+        # Wait for templates another lane is already fetching instead of asking again
+        pending = {self.fetching[template_id] for template_id in template_ids if template_id in self.fetching}
+        template_ids = [template_id for template_id in template_ids if template_id not in self.fetching]
+
+        if template_ids:
+            done = asyncio.get_running_loop().create_future()
+            for template_id in template_ids:
+                self.fetching[template_id] = done
+            try:
+                for start in range(0, len(template_ids), MAX_TEMPLATES_PER_REQUEST):
+                    chunk = template_ids[start:start + MAX_TEMPLATES_PER_REQUEST]
+                    rows = await self.api_client.get_templates(chunk)
+                    self.stats['template_fetches'] += 1
+                    for row in rows or ():
+                        self._put(row['id'], row.get('version') or 1, row.get('text_md') or '')
+                    # Deleted templates, or all of them when the request failed
+                    returned = {row['id'] for row in rows or ()}
+                    retry_at = time.monotonic() + UNAVAILABLE_RETRY_SEC
+                    for template_id in chunk:
+                        if template_id not in returned:
+                            self.unavailable[template_id] = retry_at
+            finally:
+                for template_id in template_ids:
+                    self.fetching.pop(template_id, None)
+                done.set_result(None)
+
+        if pending:
+            # wait() rather than gather(): a cancelled waiter must not cancel the shared fetch
+            await asyncio.wait(pending)
+
+    async def prefetch(self, jobs: Iterable[Job]):
+        """Fetch every template the batch references that isn't cached at that version, in one request."""
+        missing = {}
+        for job in jobs:
+            template_id = job.template_id
+            if template_id and job.template_text is None and not self._is_unavailable(template_id):
+                version = job.template_version or 1
+                if self._lookup(template_id, version) is None:
+                    missing[template_id] = version
+        if missing:
+            await self._fetch(missing)
+
+    async def get_text(self, job: Job) -> Optional[str]:
+        """Message text for a job, fetching its template on a miss. None if it can't be had."""
+        # Jobs from an API that still inlines the body
+        if job.template_text is not None:
+            return job.template_text
+        template_id = job.template_id
+        if not template_id:
+            return ''
+
+        version = job.template_version or 1
+        text = self._lookup(template_id, version)
+        if text is not None:
+            self.stats['template_hits'] += 1
+            return text
+
+        self.stats['template_misses'] += 1
+        if self._is_unavailable(template_id):
+            return None
+        await self._fetch([template_id])
+        return self._lookup(template_id, version)
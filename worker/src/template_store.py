@@ -0,0 +1,80 @@
+"""
+Saved Messages templates for SessionScript.
+
+Holds only (message id, text) per template. New saved messages are picked up
+with a single min_id history request; deletions and edits arrive as updates,
+so a sync never refetches what is already known.
+"""
+
+import logging
+from typing import Dict, List, Optional
+from telethon import events
+
+logger = logging.getLogger(__name__)
+
+
+class SavedTemplate:
+    __slots__ = ('id', 'text')
+
+    def __init__(self, id: int, text: str):
+        self.id = id
+        self.text = text
+
+
+class SavedTemplateStore:
+    def __init__(self, limit: int = 100):
+        self.limit = limit
+        self.templates: Dict[int, SavedTemplate] = {}
+        self.max_id = 0
+        self.client = None
+        self.me_id: Optional[int] = None
+
+    def __len__(self):
+        return len(self.templates)
+
+    def items(self) -> List[SavedTemplate]:
+        return list(self.templates.values())
+
+    def attach(self, client, me_id: int):
+        """Follow deletions and edits in Saved Messages through client updates."""
+        self.client = client
+        self.me_id = me_id
+        client.add_event_handler(self._on_deleted, events.MessageDeleted())
+        client.add_event_handler(self._on_edited, events.MessageEdited(chats=me_id))
+
+    def detach(self):
+        if self.client:
+            self.client.remove_event_handler(self._on_deleted)
+            self.client.remove_event_handler(self._on_edited)
+            self.client = None
+
+    async def sync(self, client) -> int:
+        """Fetch messages newer than the newest one known; returns how many were added."""
+        added = 0
+        async for message in client.iter_messages('me', limit=self.limit, min_id=self.max_id):
+            self.max_id = max(self.max_id, message.id)
+            if message.text:
+                self.templates[message.id] = SavedTemplate(message.id, message.text)
+                added += 1
+
+        # Keep the newest `limit` templates
+        if len(self.templates) > self.limit:
+            for message_id in sorted(self.templates)[:len(self.templates) - self.limit]:
+                del self.templates[message_id]
+
+        return added
+
+    async def _on_deleted(self, event):
+        # Saved Messages share the account-wide message id sequence with other
+        # private chats, so a non-channel deletion carries no chat id
+        if event.chat_id is not None:
+            return
+        for message_id in event.deleted_ids:
+            self.templates.pop(message_id, None)
+
+    async def _on_edited(self, event):
+        message = event.message
+        if message.text:
+            self.templates[message.id] = SavedTemplate(message.id, message.text)
+        else:
+            self.templates.pop(message.id, None)
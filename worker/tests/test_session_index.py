@@ -0,0 +1,79 @@
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from session_index import SessionIndex
+
+
+def make_config(tmp_path: Path, watch: str = 'poll') -> SimpleNamespace:
+    root = tmp_path / 'sessions'
+    root.mkdir()
+    config = SimpleNamespace(
+        sessions_root_dir=root,
+        session_extension='.session',
+        session_manifest_file=tmp_path / 'state' / 'session_manifest.json',
+        session_watch=watch,
+        session_watch_poll_sec=5
+    )
+    config.get_session_path = lambda key: root / key / f"{key}.session"
+    return config
+
+
+def drop_session_file(config, session_key: str):
+    config.get_session_path(session_key).write_bytes(b'session')
+
+
+def test_poll_indexes_session_file_added_to_existing_folder(tmp_path):
+    config = make_config(tmp_path)
+    (config.sessions_root_dir / '1001').mkdir()
+
+    index = SessionIndex(config)
+    index.reconcile(force=True)
+    assert len(index) == 0
+    assert index.empty_folders == {'1001'}
+
+    # Adding a file inside the folder leaves the root mtime unchanged
+    drop_session_file(config, '1001')
+    index._poll()
+
+    assert [session['session_key'] for session in index.sessions()] == ['1001']
+    assert not index.empty_folders
+
+
+def test_start_indexes_session_file_added_while_stopped(tmp_path):
+    config = make_config(tmp_path, watch='off')
+    (config.sessions_root_dir / '1001').mkdir()
+
+    index = SessionIndex(config)
+    asyncio.run(index.start())
+    assert len(index) == 0
+    asyncio.run(index.stop())
+
+    # The persisted root mtime still matches after the file is dropped in
+    drop_session_file(config, '1001')
+    restarted = SessionIndex(config)
+    asyncio.run(restarted.start())
+
+    assert [session['session_key'] for session in restarted.sessions()] == ['1001']
+    asyncio.run(restarted.stop())
+
+
+def test_deleted_session_file_is_picked_up_again_when_replaced(tmp_path):
+    config = make_config(tmp_path)
+    (config.sessions_root_dir / '1001').mkdir()
+    drop_session_file(config, '1001')
+
+    index = SessionIndex(config)
+    index.reconcile(force=True)
+    assert len(index) == 1
+
+    config.get_session_path('1001').unlink()
+    index.invalidate('1001')
+    assert len(index) == 0
+
+    drop_session_file(config, '1001')
+    index._poll()
+    assert len(index) == 1